@@ -24,11 +24,11 @@ import datetime
 import logging
 import os
 import sys
-import time
 
 from tenable.io import TenableIO
 
-import commons
+from tenable_helpers import agents, commons, stats, throttle
+from tenable_helpers.cache import Cache
 
 try:
     from keys import ACCESS_KEY, SECRET_KEY
@@ -39,40 +39,37 @@ except Exception as e:  # noqa
 logging.basicConfig(level=logging.INFO)
 
 
-def never_connect(agents):
-    headline = ['Agent Name', 'Linked On']
-    rows = []
-    for a in agents:
-        if a.get('last_connect', -1) < 0:
-            name = a.get('name')
-            linked_on = time.strftime('%Y-%m-%d',
-                                      time.localtime(a.get('linked_on', 0)))
-            rows.append((name, linked_on))
-    return headline, rows
-
-
-def plugins_never_update(agents):
-    headline = ['Agent Name', 'Linked On', 'Last Connect']
-    rows = []
-    for a in agents:
-        if int(a.get('plugin_feed_id', -1)) < 0:
-            name = a.get('name')
-            linked_on = time.strftime(
-                '%Y-%m-%d',
-                time.localtime(a.get('linked_on', 0))
-            )
-            last_connect = time.strftime(
-                '%Y-%m-%d',
-                time.localtime(a.get('last_connect', 0))
-            )
-            rows.append((name, linked_on, last_connect))
-    return headline, rows
-
-
-f = {
-    'never_connect': never_connect,
-    'plugins_never_update': plugins_never_update
-}
+def fleet_health(tio, agent_groups, names, now, workers=4, stale_days=7):
+    # a single (unfiltered) agents listing, bucketed by agent group
+    print(f'[health] Start analysis of {len(agent_groups)} agent groups')
+    health = agents.group_health(agents.iter_agents(tio, workers=workers),
+                                 names, stale_days=stale_days)
+
+    out_file = f'health.{now}.csv'
+    rows = agents.save_health(health, names, agent_groups, out_file)
+    for gid, g_name, total, *counters in rows:
+        summary = ', '.join(f'{n}: {c}' for n, c in zip(names, counters))
+        print(f'[health] {g_name} ({gid}): {total} agents, {summary}')
+    print(f'[health] Result saved: {out_file}')
+
+
+def delta_reports(tio, names, label, now, *filters, workers=4, stale_days=7):
+    # only the agents changed since the last run are fetched
+    cache = Cache()
+    deltas, baseline = agents.incremental_reports(tio, cache, names, *filters,
+                                                  workers=workers,
+                                                  stale_days=stale_days)
+    cache.close()
+    if not baseline:
+        print('[delta] First run, the state of the agents has been saved')
+        return
+
+    files = agents.save_reports(deltas, f'delta.{label}', now)
+    for arg, (headline, rows) in deltas.items():
+        added = sum(1 for r in rows if r[0] == '+')
+        print(f'[{arg}] {added} new agents, {len(rows) - added} recovered agents')  # noqa
+        if arg in files:
+            print(f'[{arg}] Result saved: {files[arg]}')
 
 
 if __name__ == '__main__':
@@ -85,24 +82,73 @@ if __name__ == '__main__':
         sys.exit(1)
 
     p = argparse.ArgumentParser()
-    p.add_argument('--never-connect', action='store_true',
-                   help='list agents that never connected after the linking')
-    p.add_argument('--plugins-never-update', action='store_true',
-                   help='list agents that never had pluging update after the linking')  # noqa
+    for r in agents.REPORTS.values():
+        p.add_argument(f'--{r.name.replace("_", "-")}', action='store_true',
+                       help=r.help)
     p.add_argument('--agent-group-id', default=None,
                    help='specify the agent group to get the agents from')
     p.add_argument('--agent-group-name', default=None,
                    help=('specify the agent group to get the agents from '
                          '(ignored if --agent-group-id is used)'))
+    p.add_argument('--all-groups', action='store_true',
+                   help=('count the agents of each report for every agent '
+                         'group (all the reports if none is selected)'))
+    p.add_argument('--workers', type=int, default=4,
+                   help='number of agents pages fetched concurrently')
+    p.add_argument('--stale-days', type=int, default=7,
+                   help='days without connection after which an agent is stale')  # noqa
+    p.add_argument('--incremental', action='store_true',
+                   help=('only fetch the agents changed since the last run '
+                         'and list the agents that entered (+) or left (-) '
+                         'each report'))
+    p.add_argument('--cache', action='store_true',
+                   help=('read the agent groups and the agents of the group '
+                         'through the local cache'))
+    p.add_argument('--read-rate', type=float, default=None,
+                   help=(f'max read requests per second (default: '
+                         f'{throttle.READ_RATE}, 0: no limit)'))
+    p.add_argument('--write-rate', type=float, default=None,
+                   help=(f'max write requests per second (default: '
+                         f'{throttle.WRITE_RATE}, 0: no limit)'))
+    p.add_argument('--stats', action='store_true',
+                   help='print API and per-phase statistics at the end')
+    p.add_argument('--profile', default=None,
+                   help='save cProfile data to the file')
     args = p.parse_args()
+    for rate in (args.read_rate, args.write_rate):
+        if rate is not None and rate < 0:
+            p.error('the rates must be from 0')
+
+    profiler = None
+    if args.stats or args.profile:
+        profiler = stats.start(args.profile)
 
     # int the api
     tio = TenableIO(ACCESS_KEY, SECRET_KEY)
+    throttle.install(tio, read_rate=args.read_rate,
+                     write_rate=args.write_rate)
+    stats.install(tio)
+
+    now = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+    names = [n for n in agents.REPORTS if getattr(args, n)]
+    cache = Cache() if args.cache else None
+    agent_groups = commons.get_agent_groups(tio, cache)
+
+    # fleet-wide health report (or changes)
+    if args.all_groups and args.incremental:
+        delta_reports(tio, names or list(agents.REPORTS), 'all', now,
+                      workers=args.workers, stale_days=args.stale_days)
+    elif args.all_groups:
+        fleet_health(tio, agent_groups, names or list(agents.REPORTS), now,
+                     workers=args.workers, stale_days=args.stale_days)
+    if args.all_groups:
+        if args.stats or args.profile:
+            stats.finish(profiler, args.profile, args.stats)
+        sys.exit(0)
 
     # obtain group id (gid) and group name (g_name)
     gid = args.agent_group_id
     g_name = args.agent_group_name
-    agent_groups = commons.get_agent_groups(tio)
     if not gid:
         if g_name:
             for g in agent_groups:
@@ -130,23 +176,26 @@ if __name__ == '__main__':
 
     print(f'[*] Looking info agent group: {g_name} ({gid})')
 
-    # filter agents
-    now = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-    for arg in ['never_connect',
-                'plugins_never_update']:
-        if getattr(args, arg):
-            print(f'[{arg}] Start analysis')
-            # get and filter agents
-            agents = commons.get_agents(tio, ('groups', 'eq', gid))
-            headline, rows = f[arg](agents)
-
-            print(f'[{arg}] {len(rows)} agents')
-
-            if len(rows) > 0:
-                # save result to file
-                out_file = f'{arg}.{gid}.{now}.csv'
-                with open(out_file, 'w') as fd:
-                    commons.as_csv(fd, headline, rows)
-                    fd.close()
-
-                print(f'[{arg}] Result saved: {out_file}')
+    # fetch the agents once and compute all the selected reports
+    if args.incremental:
+        delta_reports(tio, names or list(agents.REPORTS), gid, now,
+                      ('groups', 'eq', gid), workers=args.workers,
+                      stale_days=args.stale_days)
+        results = {}
+    elif names:
+        for n in names:
+            print(f'[{n}] Start analysis')
+        results = agents.run_reports(
+            commons.get_agents(tio, ('groups', 'eq', gid), cache=cache),
+            names, stale_days=args.stale_days)
+    else:
+        results = {}
+
+    files = agents.save_reports(results, gid, now)
+    for arg, (headline, rows) in results.items():
+        print(f'[{arg}] {len(rows)} agents')
+        if arg in files:
+            print(f'[{arg}] Result saved: {files[arg]}')
+
+    if args.stats or args.profile:
+        stats.finish(profiler, args.profile, args.stats)
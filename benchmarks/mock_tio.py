@@ -0,0 +1,354 @@
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# filters definitions returned for every "*/filters" endpoint, so that
+# pyTenable can validate the filters it sends
+FILTER_NAMES = ['category_name', 'value', 'groups', 'last_connect', 'name',
+                'status', 'platform', 'version', 'hostname', 'ipv4']
+FILTER_OPERATORS = ['eq', 'neq', 'match', 'nmatch', 'gt', 'lt', 'date-eq',
+                    'date-gt', 'date-lt']
+
+
+class MockTenableIO:
+    def __init__(self, tenant, latency=0.0, throttle=0.0, retry_after=1,
+                 seed=0):
+        self.tenant = tenant
+        self.latency = latency
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.tags = {}
+        self.assignments = {}
+        self.goals = []
+        self.exports = {}
+        self.counters = {}
+        self.throttled = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self.routes = [
+            ('GET', r'.*filters.*', self.filters),
+            ('POST', r'api/v3/assets/search', self.assets_search),
+            ('POST', r'api/v3/findings/vulnerabilities/host/search',
+             self.findings_search),
+            ('POST', r'tags/assets/assignments', self.tags_assignments),
+            ('GET', r'tags/values', self.tags_list),
+            ('POST', r'tags/values', self.tags_create),
+            ('GET', r'scanners/\d+/agent-groups', self.agent_groups_list),
+            ('GET', r'scanners/\d+/agent-groups/(\d+)',
+             self.agent_groups_details),
+            ('GET', r'scanners/\d+/agents', self.agents_list),
+            ('GET', r'networks', self.networks_list),
+            ('GET', r'networks/([^/]+)/scanners', self.networks_scanners),
+            ('GET', r'networks/([^/]+)/counts/assets-not-seen-in/(\d+)',
+             self.networks_asset_count),
+            ('POST', r'remediation/goal', self.goals_create),
+            ('POST', r'remediation/goal/search', self.goals_search),
+            ('POST', r'vulns/export', self.export_create),
+            ('GET', r'vulns/export/([^/]+)/status', self.export_status),
+            ('GET', r'vulns/export/([^/]+)/chunks/(\d+)', self.export_chunk),
+        ]
+
+    #
+    # Server
+    #
+
+    def start(self, host='127.0.0.1', port=0):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                mock.handle(self)
+
+            do_GET = _handle
+            do_POST = _handle
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        thread = threading.Thread(target=self._server.serve_forever,
+                                  daemon=True)
+        thread.start()
+        return self.url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def reset_counters(self):
+        with self._lock:
+            self.counters = {}
+            self.throttled = 0
+            self.bytes_sent = 0
+
+    def _send(self, handler, status, body, headers=None):
+        data = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        for k, v in (headers or {}).items():
+            handler.send_header(k, v)
+        handler.end_headers()
+        handler.wfile.write(data)
+        with self._lock:
+            self.bytes_sent += len(data)
+
+    def handle(self, handler):
+        url = urlparse(handler.path)
+        path = url.path.strip('/')
+        query = parse_qs(url.query)
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = json.loads(handler.rfile.read(length) or b'null')
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        for method, pattern, func in self.routes:
+            m = re.fullmatch(pattern, path)
+            if method != handler.command or not m:
+                continue
+            with self._lock:
+                key = f'{method} {pattern}'
+                self.counters[key] = self.counters.get(key, 0) + 1
+                throttled = self.random.random() < self.throttle
+                if throttled:
+                    self.throttled += 1
+            if throttled:
+                headers = {'Retry-After': str(self.retry_after)}
+                return self._send(handler, 429, {'error': 'throttled'},
+                                  headers)
+            return self._send(handler, 200, func(body, query, *m.groups()))
+
+        self._send(handler, 404, {'error': f'{handler.command} {path}'})
+
+    #
+    # Helpers
+    #
+
+    @staticmethod
+    def _page(items, offset, limit):
+        offset = int(offset or 0)
+        page = items[offset:offset + limit]
+        token = str(offset + limit) if offset + limit < len(items) else None
+        return page, token
+
+    @staticmethod
+    def _query_filters(query):
+        filters = []
+        for f in query.get('f', []):
+            name, op, value = f.split(':', 2)
+            filters.append((name, op, value))
+        return filters
+
+    def _assets_index(self, filters):
+        t = self.tenant
+        candidates = range(t.n_assets)
+        for c in (filters or {}).get('and', []):
+            prop = c.get('property')
+            value = c.get('value')
+            if prop == 'sources' and 'NESSUS_AGENT' in value:
+                idx = range(t.n_agents)
+            elif prop == 'host_name':
+                idx = sorted(t.host_index(n) for n in value)
+            elif prop == 'tags':
+                idx = set()
+                for v in value:
+                    idx |= self.assignments.get(v, set())
+                idx = sorted(idx)
+            else:
+                continue
+            if isinstance(candidates, range) and isinstance(idx, range):
+                candidates = range(max(candidates.start, idx.start),
+                                   min(candidates.stop, idx.stop))
+            else:
+                candidates = [i for i in idx if i in candidates]
+        return candidates
+
+    #
+    # Endpoints
+    #
+
+    def filters(self, body, query):
+        return {'filters': [{'name': n,
+                             'readable_name': n,
+                             'operators': FILTER_OPERATORS,
+                             'control': {'type': 'entry', 'regex': '.*'}}
+                            for n in FILTER_NAMES]}
+
+    def assets_search(self, body, query):
+        idx = self._assets_index(body.get('filter'))
+        page, token = self._page(idx, body.get('next'), body.get('limit'))
+        return {'assets': [self.tenant.asset(i) for i in page],
+                'pagination': {'next': token, 'total': len(idx)}}
+
+    def findings_search(self, body, query):
+        idx = range(self.tenant.n_assets)
+        page, token = self._page(idx, body.get('next'), body.get('limit'))
+        return {'findings': [self.tenant.finding(i) for i in page],
+                'pagination': {'next': token, 'total': len(idx)}}
+
+    def tags_assignments(self, body, query):
+        with self._lock:
+            for tag in body.get('tags', []):
+                assigned = self.assignments.setdefault(tag, set())
+                idx = [self.tenant.asset_index(a) for a in body['assets']]
+                if body.get('action') == 'add':
+                    assigned.update(idx)
+                else:
+                    assigned.difference_update(idx)
+        return {'job_uuid': str(uuid.uuid4())}
+
+    def tags_list(self, body, query):
+        tags = list(self.tags.values())
+        for name, op, value in self._query_filters(query):
+            tags = [t for t in tags if str(t.get(name)) == value]
+        offset = int(query.get('offset', [0])[0])
+        limit = int(query.get('limit', [1000])[0])
+        return {'values': tags[offset:offset + limit],
+                'pagination': {'total': len(tags), 'offset': offset,
+                               'limit': limit}}
+
+    def tags_create(self, body, query):
+        tag = {
+            'uuid': str(uuid.uuid4()),
+            'category_uuid': str(uuid.uuid5(uuid.NAMESPACE_OID,
+                                            body['category_name'])),
+            'category_name': body['category_name'],
+            'value': body['value'],
+            'description': body.get('description', '')
+        }
+        with self._lock:
+            self.tags[tag['uuid']] = tag
+        return tag
+
+    def agent_groups_list(self, body, query):
+        return {'groups': self.tenant.groups()}
+
+    def agent_groups_details(self, body, query, group_id):
+        agents = self.tenant.group_agents(int(group_id))
+        offset = int(query.get('offset', [0])[0])
+        limit = int(query.get('limit', [100])[0])
+        page = agents[offset:offset + limit]
+        group = self.tenant.group(int(group_id) - 100000)
+        group['agents'] = [self.tenant.agent(i) for i in page]
+        group['pagination'] = {'total': len(agents), 'offset': offset,
+                               'limit': limit}
+        return group
+
+    def agents_list(self, body, query):
+        t = self.tenant
+        idx = range(t.n_agents)
+        since = None
+        for name, op, value in self._query_filters(query):
+            if name == 'groups':
+                idx = t.group_agents(int(value))
+            elif name == 'last_connect' and op == 'gt':
+                since = int(value)
+            elif name == 'linked_on' and op == 'gt' and int(value) >= t.epoch:
+                # every agent is linked at epoch
+                idx = []
+        if since is not None:
+            # last_connect of agent i is epoch + i
+            idx = [i for i in idx if t.epoch + i > since]
+        offset = int(query.get('offset', [0])[0])
+        limit = int(query.get('limit', [5000])[0])
+        page = idx[offset:offset + limit]
+        return {'agents': [t.agent(i) for i in page],
+                'pagination': {'total': len(idx), 'offset': offset,
+                               'limit': limit}}
+
+    def _networks(self):
+        return [{'uuid': str(uuid.uuid5(uuid.NAMESPACE_OID, f'net{i}')),
+                 'name': f'network-{i:03d}',
+                 'is_default': i == 0,
+                 'scanner_count': i % 7,
+                 'assets_ttl_days': 180}
+                for i in range(max(5, self.tenant.n_groups))]
+
+    def networks_list(self, body, query):
+        networks = self._networks()
+        offset = int(query.get('offset', [0])[0])
+        limit = int(query.get('limit', [100])[0])
+        return {'networks': networks[offset:offset + limit],
+                'pagination': {'total': len(networks), 'offset': offset,
+                               'limit': limit}}
+
+    def networks_scanners(self, body, query, network_uuid):
+        count = {n['uuid']: n['scanner_count'] for n in self._networks()}
+        network = uuid.UUID(network_uuid)
+        scanners = [{'uuid': str(uuid.uuid5(network, f'scanner{i}')),
+                     'name': f'scanner-{i:02d}',
+                     'status': 'on'}
+                    for i in range(count.get(network_uuid, 0))]
+        return {'scanners': scanners}
+
+    def networks_asset_count(self, body, query, network_uuid, days):
+        total = self.tenant.n_assets // max(5, self.tenant.n_groups)
+        return {'numAssetsTotal': total,
+                'numAssetsNotSeen': total * int(days) // 365}
+
+    def goals_create(self, body, query):
+        goal = dict(body, goaluuid=str(uuid.uuid4()))
+        with self._lock:
+            self.goals.append(goal)
+        return goal
+
+    def goals_search(self, body, query):
+        page, token = self._page(self.goals, body.get('next'),
+                                 body.get('limit'))
+        return {'goals': page, 'pagination': {'next': token}}
+
+    def export_create(self, body, query):
+        export_uuid = str(uuid.uuid4())
+        num_assets = body.get('num_assets', 500)
+        chunks = math.ceil(self.tenant.n_assets / num_assets)
+        with self._lock:
+            self.exports[export_uuid] = (num_assets, chunks)
+        return {'export_uuid': export_uuid}
+
+    def export_status(self, body, query, export_uuid):
+        num_assets, chunks = self.exports[export_uuid]
+        return {'status': 'FINISHED',
+                'chunks_available': list(range(1, chunks + 1))}
+
+    def export_chunk(self, body, query, export_uuid, chunk_id):
+        num_assets, chunks = self.exports[export_uuid]
+        start = (int(chunk_id) - 1) * num_assets
+        stop = min(start + num_assets, self.tenant.n_assets)
+        return [self.tenant.vuln(i) for i in range(start, stop)]
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from mock_tio import MockTenableIO
+from tenant import SCALES, Tenant
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCENARIOS = ['find_assets', 'po2tag', 'po2tag_export', 'group2tag',
+             'group2tag_all', 'list_networks']
+
+
+#
+# Scenarios (run in a child process, so that each one has its own peak RSS)
+#
+
+def _tio(url):
+    from tenable.io import TenableIO
+
+    from tenable_helpers import throttle
+    tio = TenableIO('benchmark', 'benchmark', url=url)
+    throttle.install(tio)
+    return tio
+
+
+def find_assets(tio, tenant, args):
+    from tenable_helpers import commons
+    n = 0
+    for a in commons.iter_assets(tio, {}, prefetch=args.prefetch,
+                                 limit=args.page_size):
+        n += 1
+    return n
+
+
+def _po2tag(tio, tenant, args, backend):
+    from tenable_helpers.scripts import tio_po2tag
+    filters, rules = tio_po2tag.load_rules(
+        '@' + os.path.join(ROOT, 'po2tag', 'rules-20811.json'))
+    for i, r in enumerate(rules):
+        r.tag_id = f'00000000-0000-4000-8000-{i:012x}'
+    tio_po2tag.find_assets_and_assign_tags(tio, filters, rules,
+                                           page_size=args.page_size,
+                                           prefetch=args.prefetch,
+                                           workers=args.workers,
+                                           backend=backend,
+                                           stream=args.stream)
+    return tenant.n_assets
+
+
+def po2tag(tio, tenant, args):
+    return _po2tag(tio, tenant, args, 'search')
+
+
+def po2tag_export(tio, tenant, args):
+    return _po2tag(tio, tenant, args, 'export')
+
+
+def group2tag(tio, tenant, args):
+    from tenable_helpers import commons
+    from tenable_helpers.scripts import tio_group2tag
+    g = tenant.group(0)
+    index = commons.AssetIndex.from_agents_assets(tio,
+                                                  prefetch=args.prefetch)
+    return tio_group2tag.group2tag(tio, g['name'], g['id'], sync=True,
+                                   prefetch=args.prefetch, index=index)
+
+
+def group2tag_all(tio, tenant, args):
+    from tenable_helpers import commons
+    from tenable_helpers.scripts import tio_group2tag
+    index = commons.AssetIndex.from_agents_assets(tio,
+                                                  prefetch=args.prefetch)
+    results, failures = tio_group2tag.groups2tags(tio, tenant.groups(),
+                                                  args.workers, sync=True,
+                                                  prefetch=args.prefetch,
+                                                  index=index)
+    return sum(results.values())
+
+
+def list_networks(tio, tenant, args):
+    from tenable_helpers.scripts import tio_list_networks
+    networks = tio.networks.list(include_deleted=True)
+    networks = tio_list_networks.enrich(tio, networks, max(args.workers, 8))
+    return sum(1 for n in networks)
+
+
+def run_child(args):
+    tenant = Tenant.from_scale(args.scale)
+    tio = _tio(args.url)
+    scenario = globals()[args.child]
+
+    # the output of the helpers is not part of the report
+    start = time.monotonic()
+    with contextlib.redirect_stdout(io.StringIO()):
+        items = scenario(tio, tenant, args)
+    elapsed = time.monotonic() - start
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'items': items, 'seconds': elapsed, 'rss_mb': rss}))
+
+
+#
+# Runner
+#
+
+def run(args):
+    tenant = Tenant.from_scale(args.scale)
+    mock = MockTenableIO(tenant, latency=args.latency,
+                         throttle=args.throttle,
+                         retry_after=args.retry_after)
+    url = mock.start()
+    print(f'(*) Mock Tenable.io listening on {url} (scale: {args.scale}, latency: {args.latency}s, 429 rate: {args.throttle})')  # noqa
+
+    results = []
+    failed = []
+    try:
+        for scenario in args.scenario:
+            mock.reset_counters()
+            cmd = [sys.executable, os.path.abspath(__file__),
+                   '--child', scenario, '--url', url,
+                   '--scale', args.scale,
+                   '--page-size', str(args.page_size),
+                   '--prefetch', str(args.prefetch),
+                   '--workers', str(args.workers)]
+            if args.stream:
+                cmd.append('--stream')
+            res = subprocess.run(cmd, capture_output=True, text=True)
+            if res.returncode != 0:
+                print(f'(!) {scenario} failed:\n{res.stderr}')
+                failed.append(scenario)
+                continue
+            r = json.loads(res.stdout.strip().splitlines()[-1])
+            r['scenario'] = scenario
+            r['requests'] = sum(mock.counters.values())
+            r['throttled'] = mock.throttled
+            r['mb_sent'] = mock.bytes_sent / 1024 / 1024
+            results.append(r)
+    finally:
+        mock.stop()
+
+    print(f'{"scenario":<16} {"items":>9} {"seconds":>9} {"items/s":>10} {"requests":>9} {"429s":>6} {"MB sent":>8} {"peak RSS":>9}')  # noqa
+    for r in results:
+        rate = r['items'] / r['seconds'] if r['seconds'] else 0
+        print(f'{r["scenario"]:<16} {r["items"]:>9} {r["seconds"]:>9.2f} {rate:>10.1f} {r["requests"]:>9} {r["throttled"]:>6} {r["mb_sent"]:>8.1f} {r["rss_mb"]:>7.1f}MB')  # noqa
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+            fp.close()
+        print(f'(*) Result saved: {args.output}')
+
+    if failed:
+        print(f'(!) {len(failed)} scenarios failed: {", ".join(failed)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(
+        description='Offline benchmark of the helpers against a synthetic '
+                    'local Tenable.io')
+    p.add_argument('--scale', default='10k', choices=sorted(SCALES),
+                   help='size of the synthetic tenant')
+    p.add_argument('--scenario', nargs='+', default=SCENARIOS,
+                   choices=SCENARIOS, help='scenarios to run')
+    p.add_argument('--latency', type=float, default=0.0,
+                   help='latency added to each request (seconds)')
+    p.add_argument('--throttle', type=float, default=0.0,
+                   help='fraction of requests answered with a 429')
+    p.add_argument('--retry-after', type=int, default=1,
+                   help='Retry-After of the 429 responses (seconds)')
+    p.add_argument('--page-size', type=int, default=100)
+    p.add_argument('--prefetch', type=int, default=0)
+    p.add_argument('--workers', type=int, default=1)
+    p.add_argument('--stream', action='store_true',
+                   help='decode the findings one at a time (po2tag)')
+    p.add_argument('--output', default=None,
+                   help='save the results as JSON')
+    p.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    p.add_argument('--url', default=None, help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.child:
+        run_child(args)
+    else:
+        run(args)
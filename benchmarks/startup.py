@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# invocations that must not pay the tenable.io import
+TARGETS = [
+    ['--help'],
+    ['create-rg', '--help'],
+    ['group2tag', '--help'],
+    ['list-networks', '--help'],
+    ['po2tag', '--help'],
+    ['run', '--help'],
+    ['serve', '--help'],
+    ['list-networks'],  # missing credentials
+]
+
+# run the CLI in a fresh interpreter: report the time spent importing and
+# running it (interpreter startup excluded) and the heavy modules loaded
+CHILD = '''
+import sys
+import time
+t = time.perf_counter()
+from tenable_helpers import cli
+try:
+    cli.main(sys.argv[1:], prog_name='tio-helpers')
+except SystemExit:
+    pass
+elapsed = time.perf_counter() - t
+sys.stderr.write(f'{elapsed} {int("tenable.io" in sys.modules)}\\n')
+'''
+
+
+def measure(args, runs=5):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop('ACCESS_KEY', None)
+    env.pop('SECRET_KEY', None)
+    times = []
+    heavy = False
+    for _ in range(runs):
+        res = subprocess.run([sys.executable, '-c', CHILD] + args, env=env,
+                             cwd=ROOT, capture_output=True, text=True)
+        elapsed, loaded = res.stderr.strip().splitlines()[-1].split()
+        times.append(float(elapsed) * 1000)
+        heavy = heavy or loaded == '1'
+    return statistics.median(times), heavy
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(
+        description='Startup time of the tio-helpers CLI')
+    p.add_argument('--runs', type=int, default=5,
+                   help='runs of each invocation (the median is reported)')
+    p.add_argument('--max-ms', type=float, default=None,
+                   help='fail if an invocation takes longer than this')
+    args = p.parse_args()
+
+    failed = False
+    print(f'{"invocation":<32} {"median ms":>10} {"tenable.io":>11}')
+    for target in TARGETS:
+        ms, heavy = measure(target, args.runs)
+        print(f'{" ".join(target):<32} {ms:>10.1f} {"loaded" if heavy else "-":>11}')  # noqa
+        if heavy or (args.max_ms is not None and ms > args.max_ms):
+            failed = True
+
+    if failed:
+        print('(!) Startup regression: tenable.io imported or too slow')
+        sys.exit(1)
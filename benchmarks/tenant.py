@@ -0,0 +1,136 @@
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import random
+
+SCALES = {
+    '1k': {'assets': 1000, 'agents': 500, 'groups': 5},
+    '10k': {'assets': 10000, 'agents': 5000, 'groups': 10},
+    '100k': {'assets': 100000, 'agents': 50000, 'groups': 50},
+    '1m': {'assets': 1000000, 'agents': 500000, 'groups': 300},
+}
+
+SOFTWARE = [
+    'Mozilla Firefox [version {v}.0.1] [installed on 2022/09/01]',
+    'Google Chrome [version {v}.0.5195.102] [installed on 2022/09/02]',
+    'Microsoft Edge [version {v}.0.1293.70] [installed on 2022/09/03]',
+    '7-Zip 22.01 (x64) [version 22.01] [installed on 2022/07/15]',
+    'Notepad++ (64-bit x64) [version 8.4.{v}] [installed on 2022/08/10]',
+]
+
+
+class Tenant:
+    # synthetic tenant: every object is computed from its index, so even the
+    # 1M assets scale does not have to be kept in memory
+    def __init__(self, assets=10000, agents=5000, groups=10, seed=0):
+        self.n_assets = assets
+        self.n_agents = min(agents, assets)
+        self.n_groups = groups
+        self.seed = seed
+        self.epoch = 1660000000
+
+    @classmethod
+    def from_scale(cls, scale):
+        return cls(**SCALES[scale])
+
+    # assets
+
+    def asset_id(self, i):
+        return f'{i:08x}-0000-4000-8000-{i:012x}'
+
+    def asset_index(self, asset_id):
+        return int(asset_id.split('-')[0], 16)
+
+    def hostname(self, i):
+        return f'host-{i:07d}'
+
+    def host_index(self, name):
+        return int(name.split('-')[1])
+
+    def asset(self, i):
+        agent = i < self.n_agents
+        a = {
+            'id': self.asset_id(i),
+            'name': self.hostname(i),
+            'host_name': self.hostname(i),
+            'last_observed': self.epoch + i,
+            'sources': ['NESSUS_AGENT'] if agent else ['NESSUS_SCAN']
+        }
+        if agent:
+            a['agent_uuid'] = [self.agent_uuid(i)]
+        return a
+
+    # agents and groups (agent i is installed on asset i)
+
+    def agent_uuid(self, i):
+        return f'{i:032x}'
+
+    def group_id(self, g):
+        return 100000 + g
+
+    def group(self, g):
+        return {'id': self.group_id(g), 'name': f'group-{g:03d}'}
+
+    def groups(self):
+        return [self.group(g) for g in range(self.n_groups)]
+
+    def group_agents(self, group_id):
+        return range(group_id - 100000, self.n_agents, self.n_groups)
+
+    def agent(self, i):
+        r = random.Random(self.seed + i)
+        never_connected = r.random() < 0.01
+        return {
+            'id': i + 1,
+            'uuid': self.agent_uuid(i),
+            'name': self.hostname(i),
+            'linked_on': self.epoch,
+            'last_connect': -1 if never_connected else self.epoch + i,
+            'plugin_feed_id': '-1' if never_connected else '202209011234',
+            'status': 'on',
+            'groups': [self.group(i % self.n_groups)]
+        }
+
+    # findings (one software enumeration finding, plugin 20811, per asset)
+
+    def output(self, i):
+        r = random.Random(self.seed + i)
+        lines = ['The following software are installed on the remote host :',
+                 '']
+        for s in SOFTWARE:
+            lines.append(s.format(v=r.randint(100, 106)))
+        # padding to get realistic output sizes
+        for n in range(r.randint(20, 60)):
+            lines.append(f'Package {n:03d} [version 1.{n}.{r.randint(0, 9)}] [installed on 2022/01/01]')  # noqa
+        return '\n'.join(lines)
+
+    def finding(self, i):
+        return {
+            'asset': {'id': self.asset_id(i), 'name': self.hostname(i)},
+            'output': self.output(i),
+            'severity': 0
+        }
+
+    def vuln(self, i):
+        return {
+            'asset': {'uuid': self.asset_id(i), 'hostname': self.hostname(i)},
+            'output': self.output(i),
+            'plugin': {'id': 20811},
+            'severity': 'info'
+        }
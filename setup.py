@@ -39,10 +39,16 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=get_requirements(),
+    extras_require={
+        'async': ['httpx'],
+        'fast': ['ijson', 'orjson'],
+        'jobs': ['PyYAML'],
+    },
     entry_points={
         'console_scripts': [
             'tio-create-rg = tenable_helpers.scripts.tio_create_rg:tio_create_rg',  # noqa
             'tio-group2tag = tenable_helpers.scripts.tio_group2tag:tio_group2tag',  # noqa
+            'tio-helpers = tenable_helpers.cli:main',
             'tio-list-networks = tenable_helpers.scripts.tio_list_networks:tio_list_networks',  # noqa
             'tio-po2tag = tenable_helpers.scripts.tio_po2tag:tio_po2tag',
         ],
@@ -0,0 +1,294 @@
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import itertools
+import json
+import time
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from tenable_helpers import commons, decoding, stats
+
+SCANNER_ID = 1
+
+# reports that can be computed over a stream of agents (timed reports
+# depend on the current time, not only on the agent)
+Report = namedtuple('Report', ['name', 'headline', 'help', 'row', 'timed'])
+REPORTS = {}
+
+# headline of the delta reports of the incremental mode
+DELTA_HEADLINE = ['Change', 'Agent Name', 'Linked On', 'Last Connect']
+
+
+class Agent:
+    # only the fields used by the reports, without a per-agent dict
+    __slots__ = ('id', 'uuid', 'name', 'status', 'linked_on',
+                 'last_connect', 'plugin_feed_id', 'groups')
+
+    def __init__(self, id, uuid, name, status, linked_on, last_connect,
+                 plugin_feed_id, groups):
+        self.id = id
+        self.uuid = uuid
+        self.name = name
+        self.status = status
+        self.linked_on = linked_on
+        self.last_connect = last_connect
+        self.plugin_feed_id = plugin_feed_id
+        self.groups = groups
+
+    @classmethod
+    def from_dict(cls, a):
+        return cls(a.get('id'),
+                   a.get('uuid'),
+                   a.get('name'),
+                   a.get('status'),
+                   a.get('linked_on', 0),
+                   a.get('last_connect', -1),
+                   int(a.get('plugin_feed_id', -1)),
+                   tuple(g.get('id') for g in a.get('groups') or []))
+
+    def as_dict(self):
+        d = {k: getattr(self, k) for k in self.__slots__}
+        d['groups'] = [{'id': g} for g in self.groups]
+        return d
+
+
+def _agents_page(tio, params, offset, limit):
+    params = params + [('offset', offset), ('limit', limit)]
+    res = tio.get(f'scanners/{SCANNER_ID}/agents', params=params)
+    with stats.phase('decode'):
+        data = decoding.loads(res.content)
+    stats.count('pages')
+    return data.get('agents') or [], data.get('pagination', {}).get('total', 0)
+
+
+def iter_agents(tio, *filters, limit=5000, workers=1):
+    # one agents listing: the first page gives the total, the following
+    # ones are fetched (by offset) with up to `workers` requests in flight
+    params = [('f', f'{f[0]}:{f[1]}:{f[2]}') for f in filters]
+    if params:
+        params.append(('ft', 'and'))
+    agents, total = _agents_page(tio, params, 0, limit)
+    yield from agents
+    if len(agents) == 0:
+        return
+
+    offsets = iter(range(len(agents), total, limit))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        for offset in offsets:
+            pending.append(pool.submit(_agents_page, tio, params, offset,
+                                       limit))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            agents, _ = pending.popleft().result()
+            offset = next(offsets, None)
+            if offset is not None:
+                pending.append(pool.submit(_agents_page, tio, params, offset,
+                                           limit))
+            yield from agents
+
+
+def report(name, headline, help=None, timed=False):
+    def _register(row):
+        REPORTS[name] = Report(name, headline, help, row, timed)
+        return row
+    return _register
+
+
+def _opts(now=None, stale_days=7):
+    return {'now': now or time.time(), 'stale_days': stale_days}
+
+
+def _agents(agents):
+    for a in agents:
+        if not isinstance(a, Agent):
+            a = Agent.from_dict(a)
+        stats.count('agents')
+        yield a
+
+
+def run_reports(agents, names, **kwargs):
+    # single pass: every agent is converted once and handed to all the
+    # reports, only the resulting rows are kept
+    opts = _opts(**kwargs)
+    reports = [REPORTS[n] for n in names]
+    rows = {n: [] for n in names}
+    with stats.phase('reports'):
+        for a in _agents(agents):
+            for r in reports:
+                row = r.row(a, opts)
+                if row is not None:
+                    rows[r.name].append(row)
+    return {n: (REPORTS[n].headline, rows[n]) for n in names}
+
+
+def group_health(agents, names, **kwargs):
+    # single pass over the whole fleet: per agent group, the number of
+    # agents and the number of them that show up in each report
+    opts = _opts(**kwargs)
+    reports = [REPORTS[n] for n in names]
+    health = defaultdict(lambda: [0] * (len(reports) + 1))
+    with stats.phase('reports'):
+        for a in _agents(agents):
+            hits = [r.row(a, opts) is not None for r in reports]
+            for gid in a.groups or (None,):
+                counters = health[gid]
+                counters[0] += 1
+                for i, hit in enumerate(hits, 1):
+                    counters[i] += hit
+    return dict(health)
+
+
+def health_table(health, names, agent_groups):
+    group_names = {g['id']: g['name'] for g in agent_groups}
+    headline = ['Group ID', 'Group Name', 'Agents'] + names
+    rows = []
+    for gid, counters in sorted(health.items(), key=lambda x: str(x[0])):
+        g_name = group_names.get(gid, '-') if gid is not None else '-'
+        rows.append([gid if gid is not None else '-', g_name] + counters)
+    return headline, rows
+
+
+def save_health(health, names, agent_groups, out_file):
+    headline, rows = health_table(health, names, agent_groups)
+    with open(out_file, 'w') as fd:
+        commons.as_csv(fd, headline, rows)
+    return rows
+
+
+def save_reports(results, label, now):
+    # a CSV file for each report with at least one agent
+    files = {}
+    for n, (headline, rows) in results.items():
+        if len(rows) > 0:
+            files[n] = f'{n}.{label}.{now}.csv'
+            with open(files[n], 'w') as fd:
+                commons.as_csv(fd, headline, rows)
+    return files
+
+
+def _delta_row(change, a):
+    return change, a.name, _date(a.linked_on), _date(a.last_connect)
+
+
+def incremental_reports(tio, cache, names, *filters, workers=1, **kwargs):
+    # the agents of the previous run and the reports they showed up in are
+    # kept in the cache: only the agents that connected or were linked
+    # after the watermarks are fetched and evaluated again, the others only
+    # against the timed reports
+    entity = 'agent_reports'
+    scope = json.dumps(filters)
+    opts = _opts(**kwargs)
+    meta = cache.meta(entity, scope)
+    previous = {}
+    if meta:
+        previous = {r['id']: r for r in cache.records(entity, scope)}
+    watermark = (meta or {}).get('watermark')
+    full = (not meta or not watermark or
+            opts['now'] - meta['created'] >= cache.max_age)
+
+    if full:
+        changed = iter_agents(tio, *filters, workers=workers)
+        watermark = {'last_connect': 0, 'linked_on': 0}
+    else:
+        changed = itertools.chain(
+            iter_agents(tio, *filters,
+                        ('last_connect', 'gt', watermark['last_connect']),
+                        workers=workers),
+            iter_agents(tio, *filters,
+                        ('linked_on', 'gt', watermark['linked_on']),
+                        workers=workers))
+
+    # evaluate the changed agents against all the reports
+    reports = list(REPORTS.values())
+    current = {}
+    with stats.phase('reports'):
+        for a in _agents(changed):
+            r = a.as_dict()
+            r['reports'] = [x.name for x in reports
+                            if x.row(a, opts) is not None]
+            current[a.id] = r
+            for k in watermark:
+                watermark[k] = max(watermark[k], getattr(a, k) or 0)
+
+        # the others only against the timed ones
+        timed = [x for x in reports if x.timed]
+        for id, r in previous.items():
+            if id in current or full:
+                continue
+            a = Agent.from_dict(r)
+            members = [n for n in r['reports']
+                       if n in REPORTS and not REPORTS[n].timed]
+            members += [x.name for x in timed if x.row(a, opts) is not None]
+            if sorted(members) != sorted(r['reports']):
+                current[id] = dict(r, reports=members)
+
+    # agents that entered (+) or left (-) each selected report
+    deltas = {n: [] for n in names}
+    if previous:
+        for id, r in current.items():
+            before = previous.get(id, {}).get('reports', [])
+            a = Agent.from_dict(r)
+            for n in names:
+                if n in r['reports'] and n not in before:
+                    deltas[n].append(_delta_row('+', a))
+                elif n in before and n not in r['reports']:
+                    deltas[n].append(_delta_row('-', a))
+
+    if full:
+        cache.store(entity, current.values(), 'id', scope, watermark)
+    else:
+        cache.store(entity, current.values(), 'id', scope, watermark,
+                    replace=False)
+    stats.count('agents re-evaluated', len(current))
+    return {n: (DELTA_HEADLINE, deltas[n]) for n in names}, bool(previous)
+
+
+def _date(ts):
+    return time.strftime('%Y-%m-%d', time.localtime(max(ts or 0, 0)))
+
+
+#
+# Reports
+#
+
+@report('never_connect', ['Agent Name', 'Linked On'],
+        'list agents that never connected after the linking')
+def never_connect(a, opts):
+    if a.last_connect is None or a.last_connect < 0:
+        return a.name, _date(a.linked_on)
+
+
+@report('plugins_never_update', ['Agent Name', 'Linked On', 'Last Connect'],
+        'list agents that never had pluging update after the linking')
+def plugins_never_update(a, opts):
+    if a.plugin_feed_id < 0:
+        return a.name, _date(a.linked_on), _date(a.last_connect)
+
+
+@report('stale', ['Agent Name', 'Linked On', 'Last Connect'],
+        'list agents that did not connect recently (see --stale-days)',
+        timed=True)
+def stale(a, opts):
+    if a.last_connect is None or a.last_connect < 0:
+        return None
+    if a.last_connect < opts['now'] - opts['stale_days'] * 86400:
+        return a.name, _date(a.linked_on), _date(a.last_connect)
@@ -0,0 +1,291 @@
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+import logging
+
+from tenable_helpers import decoding
+from tenable_helpers.throttle import AsyncScheduler, retry_after
+
+try:
+    import httpx
+except ImportError:  # optional dependency (pip install tenable_helpers[async])
+    httpx = None
+
+LOG = logging.getLogger(__name__)
+
+SCANNER_ID = 1
+
+
+def _sort(sort):
+    return [{'property': s[0], 'order': s[1]} if isinstance(s, tuple) else s
+            for s in (sort or [])]
+
+
+class _Endpoint:
+    def __init__(self, api):
+        self._api = api
+
+
+class _ExploreSearch(_Endpoint):
+    def __init__(self, api, path):
+        super().__init__(api)
+        self._path = path
+
+    async def _search(self, filter=None, sort=None, fields=None, limit=100,
+                      next=None, return_resp=False):
+        payload = {
+            'filter': filter or {},
+            'sort': _sort(sort),
+            'fields': fields or [],
+            'limit': limit
+        }
+        if next:
+            payload['next'] = next
+        res = await self._api.post(self._path, json=payload)
+        if return_resp:
+            return res
+        return decoding.loads(res.content)
+
+
+class _Assets(_ExploreSearch):
+    def __init__(self, api):
+        super().__init__(api, 'api/v3/assets/search')
+
+    async def search_all(self, **kwargs):
+        return await self._search(**kwargs)
+
+
+class _Findings(_ExploreSearch):
+    def __init__(self, api):
+        super().__init__(api, 'api/v3/findings/vulnerabilities/host/search')
+
+    async def search_host(self, **kwargs):
+        return await self._search(**kwargs)
+
+
+class _Namespace:
+    pass
+
+
+class _Tags(_Endpoint):
+    async def _assignments(self, action, assets, tags):
+        payload = {'action': action, 'assets': assets, 'tags': tags}
+        res = await self._api.post('tags/assets/assignments', json=payload)
+        return res.json().get('job_uuid')
+
+    async def assign(self, assets, tags):
+        return await self._assignments('add', assets, tags)
+
+    async def unassign(self, assets, tags):
+        return await self._assignments('remove', assets, tags)
+
+
+class _AgentGroups(_Endpoint):
+    async def list(self):
+        res = await self._api.get(f'scanners/{SCANNER_ID}/agent-groups')
+        return res.json().get('groups', [])
+
+    async def details(self, group_id, limit=100, offset=0):
+        params = {'limit': limit, 'offset': offset}
+        res = await self._api.get(
+            f'scanners/{SCANNER_ID}/agent-groups/{group_id}', params=params)
+        return res.json()
+
+
+class _Agents(_Endpoint):
+    async def list(self, *filters, limit=1000):
+        params = [('limit', limit), ('ft', 'and')]
+        params += [('f', f'{f[0]}:{f[1]}:{f[2]}') for f in filters]
+        offset = 0
+        while True:
+            res = await self._api.get(f'scanners/{SCANNER_ID}/agents',
+                                      params=params + [('offset', offset)])
+            data = res.json()
+            agents = data.get('agents') or []
+            for a in agents:
+                yield a
+            offset += len(agents)
+            total = data.get('pagination', {}).get('total', 0)
+            if len(agents) == 0 or offset >= total:
+                return
+
+
+class _Networks(_Endpoint):
+    async def list(self, include_deleted=False, limit=100):
+        offset = 0
+        while True:
+            params = {'limit': limit, 'offset': offset}
+            if include_deleted:
+                params['includeDeleted'] = 'true'
+            res = await self._api.get('networks', params=params)
+            data = res.json()
+            networks = data.get('networks') or []
+            for n in networks:
+                yield n
+            offset += len(networks)
+            total = data.get('pagination', {}).get('total', 0)
+            if len(networks) == 0 or offset >= total:
+                return
+
+    async def list_scanners(self, network_id):
+        res = await self._api.get(f'networks/{network_id}/scanners')
+        return res.json().get('scanners', [])
+
+    async def network_asset_count(self, network_id, num_days):
+        res = await self._api.get(
+            f'networks/{network_id}/counts/assets-not-seen-in/{num_days}')
+        return res.json()
+
+
+class AsyncTenableIO:
+    def __init__(self, access_key, secret_key,
+                 url='https://cloud.tenable.com', max_connections=32,
+                 timeout=120, retries=5, scheduler=None):
+        if httpx is None:
+            raise ImportError('httpx is required by the asyncio client '
+                              '(pip install tenable_helpers[async])')
+        headers = {
+            'X-ApiKeys': f'accessKey={access_key};secretKey={secret_key}',
+            'Accept': 'application/json'
+        }
+        limits = httpx.Limits(max_connections=max_connections,
+                              max_keepalive_connections=max_connections)
+        self._client = httpx.AsyncClient(base_url=url, headers=headers,
+                                         limits=limits, timeout=timeout)
+        self.retries = retries
+        # same read/write budgets as the synchronous client
+        self.scheduler = scheduler or AsyncScheduler(max_retries=retries)
+
+        # endpoints
+        self.v3 = _Namespace()
+        self.v3.explore = _Namespace()
+        self.v3.explore.assets = _Assets(self)
+        self.v3.explore.findings = _Findings(self)
+        self.tags = _Tags(self)
+        self.agent_groups = _AgentGroups(self)
+        self.agents = _Agents(self)
+        self.networks = _Networks(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def request(self, method, path, **kwargs):
+        # the rate limits (429) are handled by the scheduler, the server
+        # errors here
+        budget = self.scheduler.budget(method, path)
+        attempt = 0
+        while True:
+            res = await self.scheduler.call(budget, self._client.request,
+                                            method, path, **kwargs)
+            if res.status_code < 500 or attempt >= self.retries:
+                res.raise_for_status()
+                return res
+            attempt += 1
+            delay = retry_after(res, default=attempt)
+            LOG.debug(f'{method} {path}: {res.status_code}, retry in {delay}s')  # noqa
+            await asyncio.sleep(delay)
+
+    async def get(self, path, **kwargs):
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request('POST', path, **kwargs)
+
+
+#
+# Helpers
+#
+
+async def gather_bounded(coros, limit=16):
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*[_run(c) for c in coros])
+
+
+async def iter_assets(api, filters, pages=False, limit=100):
+    token = None
+    while True:
+        data = await api.v3.explore.assets.search_all(filter=filters,
+                                                      limit=limit,
+                                                      next=token)
+        _assets = data.get('assets') or []
+        if len(_assets) > 0:
+            if pages:
+                yield _assets
+            else:
+                for a in _assets:
+                    yield a
+        token = (data.get('pagination') or {}).get('next')
+        if not token:
+            return
+
+
+async def find_assets(api, filters, cb, *args, **kwargs):
+    assets = []
+    async for _assets in iter_assets(api, filters, pages=True):
+        if cb:
+            res = cb(api, _assets, *args, **kwargs)
+            if asyncio.iscoroutine(res):
+                await res
+        assets += _assets
+    return assets
+
+
+async def get_agent_groups(api):
+    ag = []
+    try:
+        ag = await api.agent_groups.list()
+    except Exception as e:
+        LOG.error(e)
+    return ag
+
+
+async def get_agents(api, *filters):
+    agents = []
+    try:
+        agents = [a async for a in api.agents.list(*filters)]
+    except Exception as e:
+        LOG.error(e)
+    return agents
+
+
+async def assign_tag(api, tag_id, asset_ids, batch_size=1000, limit=8):
+    # bulk requests sent concurrently
+    batches = [asset_ids[i:i + batch_size]
+               for i in range(0, len(asset_ids), batch_size)]
+    return await gather_bounded([api.tags.assign(b, [tag_id])
+                                 for b in batches], limit)
+
+
+async def unassign_tag(api, tag_id, asset_ids, batch_size=1000, limit=8):
+    batches = [asset_ids[i:i + batch_size]
+               for i in range(0, len(asset_ids), batch_size)]
+    return await gather_bounded([api.tags.unassign(b, [tag_id])
+                                 for b in batches], limit)
@@ -0,0 +1,179 @@
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_DIR = os.path.join(
+    os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'tenable-helpers'
+)
+
+# seconds before cached data must be refreshed (incrementally, if the entity
+# supports it)
+DEFAULT_TTL = {
+    'agent_groups': 3600,
+    'agents': 900,
+    'agent_assets': 900,
+    'tags': 3600,
+}
+
+# seconds before cached data must be fetched again from scratch (an
+# incremental refresh can't see deleted records)
+DEFAULT_MAX_AGE = 86400
+
+
+class Cache:
+    def __init__(self, path=None, ttl=None, max_age=DEFAULT_MAX_AGE):
+        if path is None:
+            path = os.getenv('TIO_HELPERS_CACHE',
+                             os.path.join(DEFAULT_DIR, 'cache.db'))
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl = dict(DEFAULT_TTL)
+        self.ttl.update(ttl or {})
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS records ('
+                             'entity TEXT, scope TEXT, key TEXT, data TEXT, '
+                             'PRIMARY KEY (entity, scope, key))')
+            self._db.execute('CREATE TABLE IF NOT EXISTS meta ('
+                             'entity TEXT, scope TEXT, refreshed REAL, '
+                             'created REAL, watermark TEXT, '
+                             'PRIMARY KEY (entity, scope))')
+
+    def close(self):
+        self._db.close()
+
+    def meta(self, entity, scope=''):
+        with self._lock:
+            row = self._db.execute('SELECT refreshed, created, watermark '
+                                   'FROM meta WHERE entity=? AND scope=?',
+                                   (entity, scope)).fetchone()
+        if not row:
+            return None
+        return {
+            'refreshed': row[0],
+            'created': row[1],
+            'watermark': json.loads(row[2]) if row[2] else None
+        }
+
+    def records(self, entity, scope=''):
+        with self._lock:
+            rows = self._db.execute('SELECT data FROM records '
+                                    'WHERE entity=? AND scope=?',
+                                    (entity, scope)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def store(self, entity, records, key, scope='', watermark=None,
+              replace=True):
+        now = time.time()
+        rows = [(entity, scope, str(r.get(key)), json.dumps(r))
+                for r in records]
+        with self._lock, self._db:
+            created = now
+            if replace:
+                self._db.execute('DELETE FROM records '
+                                 'WHERE entity=? AND scope=?',
+                                 (entity, scope))
+            else:
+                row = self._db.execute('SELECT created FROM meta '
+                                       'WHERE entity=? AND scope=?',
+                                       (entity, scope)).fetchone()
+                if row:
+                    created = row[0]
+            self._db.executemany('INSERT OR REPLACE INTO records '
+                                 'VALUES (?, ?, ?, ?)', rows)
+            self._db.execute('INSERT OR REPLACE INTO meta '
+                             'VALUES (?, ?, ?, ?, ?)',
+                             (entity, scope, now, created,
+                              json.dumps(watermark)))
+
+    def put(self, entity, records, key, scope=''):
+        # records changed locally: cached without changing the refresh time
+        # of the entity
+        rows = [(entity, scope, str(r.get(key)), json.dumps(r))
+                for r in records]
+        with self._lock, self._db:
+            self._db.executemany('INSERT OR REPLACE INTO records '
+                                 'VALUES (?, ?, ?, ?)', rows)
+
+    def fresh(self, entity, scope=''):
+        meta = self.meta(entity, scope)
+        return (meta is not None and
+                time.time() - meta['refreshed'] < self.ttl.get(entity, 0))
+
+    def clear(self, entity=None):
+        with self._lock, self._db:
+            if entity:
+                self._db.execute('DELETE FROM records WHERE entity=?',
+                                 (entity,))
+                self._db.execute('DELETE FROM meta WHERE entity=?',
+                                 (entity,))
+            else:
+                self._db.execute('DELETE FROM records')
+                self._db.execute('DELETE FROM meta')
+
+    def read_through(self, entity, fetch, key, scope='', fetch_since=None,
+                     watermark_of=None):
+        # fetch(): all the records
+        # fetch_since(watermark): the records changed after the watermark
+        # watermark_of(record): the value the watermark is computed from
+        # fresh enough
+        if self.fresh(entity, scope):
+            LOG.debug(f'Cache hit ({entity}/{scope})')
+            return self.records(entity, scope)
+
+        now = time.time()
+        meta = self.meta(entity, scope)
+
+        # incremental refresh
+        incremental = (meta and fetch_since and watermark_of and
+                       meta['watermark'] is not None and
+                       now - meta['created'] < self.max_age)
+        if incremental:
+            changed = list(fetch_since(meta['watermark']))
+            watermark = meta['watermark']
+            for r in changed:
+                w = watermark_of(r)
+                if w is not None and w > watermark:
+                    watermark = w
+            LOG.debug(f'Cache refresh ({entity}/{scope}): {len(changed)} changed records')  # noqa
+            self.store(entity, changed, key, scope, watermark, replace=False)
+            return self.records(entity, scope)
+
+        # full refresh
+        records = list(fetch())
+        watermark = None
+        if watermark_of:
+            marks = [watermark_of(r) for r in records]
+            marks = [m for m in marks if m is not None]
+            watermark = max(marks) if marks else None
+        LOG.debug(f'Cache load ({entity}/{scope}): {len(records)} records')
+        self.store(entity, records, key, scope, watermark)
+        return records
@@ -0,0 +1,121 @@
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+
+def run_id(*args):
+    # fingerprint of the inputs of a run: a checkpoint is only resumed by
+    # a run with the same inputs
+    data = json.dumps(args, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class Checkpoint:
+    def __init__(self, path, run, interval=10):
+        self.path = path
+        self.journal_path = f'{path}.journal'
+        self.run = run
+        self.interval = interval
+        self.state = {}
+        self.resumed = False
+        self._journal = {}
+        self._added = {}
+        self._lock = threading.Lock()
+        self._saved = time.monotonic()
+        if os.path.exists(path):
+            with open(path, 'r') as fp:
+                data = json.load(fp)
+            if data.get('run') == run:
+                self.state = data.get('state') or {}
+                self._journal = self._load_journal()
+                self.resumed = True
+            else:
+                LOG.warning(f'{path} belongs to another run, starting over')
+        if not self.resumed and os.path.exists(self.journal_path):
+            os.unlink(self.journal_path)
+
+    def _load_journal(self):
+        journal = {}
+        if not os.path.exists(self.journal_path):
+            return journal
+        with open(self.journal_path, 'r') as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the run died while appending this line
+                    break
+                journal.setdefault(entry['key'], []).extend(entry['items'])
+        return journal
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self.state.get(key, default)
+
+    def journal(self, key):
+        # all the items added to "key" by the previous runs
+        return self._journal.get(key, [])
+
+    def set(self, key, value, force=False):
+        self.update(force=force, **{key: value})
+
+    def add(self, key, items):
+        # items that only grow (e.g. the processed IDs): appended to the
+        # journal when saved, instead of rewriting them every time
+        with self._lock:
+            self._added.setdefault(key, []).extend(items)
+
+    def update(self, force=False, **state):
+        # values are serialized when saved: they must not be changed by
+        # other threads in the meanwhile (sets are saved as lists)
+        with self._lock:
+            self.state.update(state)
+            if force or time.monotonic() - self._saved >= self.interval:
+                self._save()
+
+    def _save(self):
+        # the state first: if the run dies before the journal is written,
+        # the items added in the meanwhile are only processed again
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as fp:
+            json.dump({'run': self.run, 'state': self.state}, fp,
+                      default=list)
+        os.replace(tmp, self.path)
+        if self._added:
+            with open(self.journal_path, 'a') as fp:
+                for key, items in self._added.items():
+                    fp.write(json.dumps({'key': key, 'items': items},
+                                        default=list) + '\n')
+            self._added = {}
+        self._saved = time.monotonic()
+
+    def remove(self):
+        # the run is over
+        with self._lock:
+            for path in (self.path, self.journal_path):
+                if os.path.exists(path):
+                    os.unlink(path)
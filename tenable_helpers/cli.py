@@ -0,0 +1,78 @@
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import importlib
+import os
+
+import click
+
+from tenable_helpers import version
+
+# subcommand -> (module, command, short help); the modules are imported only
+# when their subcommand runs
+COMMANDS = {
+    'create-rg': ('tenable_helpers.scripts.tio_create_rg', 'tio_create_rg',
+                  'Create a remediation goal'),
+    'group2tag': ('tenable_helpers.scripts.tio_group2tag', 'tio_group2tag',
+                  'Tag the assets of agent groups'),
+    'list-networks': ('tenable_helpers.scripts.tio_list_networks',
+                      'tio_list_networks', 'List the networks'),
+    'po2tag': ('tenable_helpers.scripts.tio_po2tag', 'tio_po2tag',
+               'Tag the assets by plugin output'),
+    'run': ('tenable_helpers.runner', 'tio_run',
+            'Run the jobs of a job file, sharing their reads'),
+    'serve': ('tenable_helpers.daemon', 'serve',
+              'Run the helpers as a daemon accepting jobs'),
+}
+
+
+def get_keys():
+    # API keys from keys.py (if importable) or from the environment
+    try:
+        from keys import ACCESS_KEY, SECRET_KEY
+    except Exception as e:  # noqa
+        return os.getenv('ACCESS_KEY'), os.getenv('SECRET_KEY')
+    return ACCESS_KEY, SECRET_KEY
+
+
+class LazyGroup(click.Group):
+    def list_commands(self, ctx):
+        return sorted(COMMANDS)
+
+    def get_command(self, ctx, name):
+        if name not in COMMANDS:
+            return None
+        module, command, _ = COMMANDS[name]
+        return getattr(importlib.import_module(module), command)
+
+    def format_commands(self, ctx, formatter):
+        # static short help: listing the subcommands doesn't import them
+        rows = [(n, COMMANDS[n][2]) for n in self.list_commands(ctx)]
+        with formatter.section('Commands'):
+            formatter.write_dl(rows)
+
+
+@click.group(cls=LazyGroup)
+@click.version_option(version)
+def main():
+    """Tenable.io helpers"""
+
+
+if __name__ == '__main__':
+    main()
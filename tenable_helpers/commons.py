@@ -21,7 +21,12 @@ import csv
 import json
 import logging
 import os
-import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tenable_helpers import pagination, stats
 
 LOG = logging.getLogger(__name__)
 
@@ -38,25 +43,28 @@ def as_csv(fd, headline, rows):
 
 
 def str_to_json(json_str):
+    # raises ValueError: the scripts exit, the jobs of the runner and of the
+    # daemon fail alone
     f = {}
-    try:
-        if json_str.startswith('@'):
-            # load filters from file
-            ffile = json_str[1:]
-            if not os.path.exists(ffile):
-                LOG.error(f'{ffile} does not exist')
-            else:
-                LOG.debug(f'Load JSON from file ({ffile})')
-                with open(ffile, 'r') as fp:
-                    f = json.load(fp)
-                    fp.close()
-        else:
-            # load filters from string
-            LOG.debug(f'Load JSON from string ({json_str})')
+    if json_str.startswith('@'):
+        # load filters from file
+        ffile = json_str[1:]
+        if not os.path.exists(ffile):
+            raise ValueError(f'{ffile} does not exist')
+        LOG.debug(f'Load JSON from file ({ffile})')
+        try:
+            with open(ffile, 'r') as fp:
+                f = json.load(fp)
+                fp.close()
+        except Exception as e:
+            raise ValueError(f'Unable to load JSON file {ffile}: {e}')
+    else:
+        # load filters from string
+        LOG.debug(f'Load JSON from string ({json_str})')
+        try:
             f = json.loads(json_str)
-    except Exception as e:
-        LOG.error(f'Unable to load JSON string: {e}')
-        sys.exit(1)
+        except Exception as e:
+            raise ValueError(f'Unable to load JSON string: {e}')
 
     print(f'(*) JSON: {json.dumps(f)}')
     return f
@@ -66,10 +74,14 @@ def str_to_json(json_str):
 #
 
 
-def get_agent_groups(tio):
+def get_agent_groups(tio, cache=None):
     ag = []
     try:
-        ag = tio.agent_groups.list()
+        if cache:
+            ag = cache.read_through('agent_groups', tio.agent_groups.list,
+                                    'id')
+        else:
+            ag = tio.agent_groups.list()
     except Exception as e:
         LOG.error(e)
     return ag
@@ -109,10 +121,21 @@ def select_agent_group(agent_groups):
 #
 
 
-def get_agents(tio, *filters):
+def get_agents(tio, *filters, cache=None):
+    def _fetch():
+        return tio.agents.list(*filters)
+
+    def _fetch_since(watermark):
+        return tio.agents.list(*filters, ('last_connect', 'gt', watermark))
+
     agents = []
     try:
-        agents = tio.agents.list(*filters)
+        if cache:
+            agents = cache.read_through('agents', _fetch, 'id',
+                                        json.dumps(filters), _fetch_since,
+                                        lambda a: a.get('last_connect'))
+        else:
+            agents = _fetch()
     except Exception as e:
         LOG.error(e)
     return agents
@@ -122,7 +145,115 @@ def get_agents(tio, *filters):
 #
 
 
-def create_tag(tio, category, name, delete_assignments=False):
+class TagRegistry:
+    def __init__(self, tio, maxsize=10000, cache=None, load=True):
+        self.tio = tio
+        self.maxsize = maxsize
+        self.cache = cache
+        # set once all the tags have been loaded from the API (and none was
+        # evicted): a tag missing from the registry does not exist
+        self.complete = False
+        self._tags = OrderedDict()
+        self._lock = threading.Lock()
+        if load:
+            self.load()
+
+    def __len__(self):
+        return len(self._tags)
+
+    def _put(self, tag):
+        key = (tag.get('category_name'), tag.get('value'))
+        with self._lock:
+            self._tags[key] = tag
+            self._tags.move_to_end(key)
+            while len(self._tags) > self.maxsize:
+                self._tags.popitem(last=False)
+                self.complete = False
+
+    def load(self):
+        # all the category:value pairs in one (paginated) pass
+        # a cached list may miss the tags created since it was fetched (by
+        # other tools): its misses are looked up
+        live = True
+        try:
+            if self.cache:
+                live = not self.cache.fresh('tags')
+                tags = self.cache.read_through('tags', self.tio.tags.list,
+                                               'uuid')
+            else:
+                tags = list(self.tio.tags.list())
+        except Exception as e:
+            LOG.error(e)
+            return
+        for t in tags:
+            self._put(t)
+        self.complete = live and len(tags) <= self.maxsize
+        LOG.debug(f'Loaded {len(self)} tags')
+
+    def get(self, category, value):
+        key = (category, value)
+        with self._lock:
+            tag = self._tags.get(key)
+            if tag:
+                self._tags.move_to_end(key)
+                return tag
+            if self.complete:
+                return None
+
+        # not loaded (or evicted): ask the API
+        tag = next(self.tio.tags.list(('category_name', 'eq', category),
+                                      ('value', 'eq', value),
+                                      limit=1), None)
+        if tag:
+            self._put(tag)
+        return tag
+
+    def create(self, category, value):
+        description = 'Created via API'
+        tag = self.tio.tags.create(category, value, description=description,
+                                   category_description=description)
+        self._put(tag)
+        if self.cache:
+            self.cache.put('tags', [tag], 'uuid')
+        return tag
+
+    def create_many(self, pairs, workers=4):
+        tags = {}
+        missing = []
+        for category, value in pairs:
+            tag = self.get(category, value)
+            if tag:
+                tags[(category, value)] = tag
+            elif (category, value) not in missing:
+                missing.append((category, value))
+
+        # the first value of a new category is created alone, so that the
+        # category is not created twice by concurrent requests
+        categories = set(k[0] for k in self._tags)
+        first = []
+        others = []
+        for category, value in missing:
+            if category not in categories:
+                categories.add(category)
+                first.append((category, value))
+            else:
+                others.append((category, value))
+
+        for category, value in first:
+            tags[(category, value)] = self.create(category, value)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(self.create, c, v): (c, v)
+                       for c, v in others}
+            for f in as_completed(futures):
+                tags[futures[f]] = f.result()
+
+        if missing:
+            print(f'(*) Created {len(missing)} tags')
+        return tags
+
+
+def create_tag(tio, category, name, delete_assignments=False, prefetch=0,
+               registry=None):
     def _cb(tio, assets, tag_uuid):
         _assets_id = [a.get('id') for a in assets]
         _assets_name = [a.get('name') for a in assets]
@@ -130,17 +261,25 @@ def create_tag(tio, category, name, delete_assignments=False):
         print(f'(*) Tag "{category}:{name}" has been removed from {"|".join(_assets_name)}')  # noqa
         tio.tags.unassign(_assets_id, _tags)
 
-    tag = next(tio.tags.list(('category_name', 'eq', category),
-                             ('value', 'eq', name),
-                             limit=1), None)
+    if registry:
+        tag = registry.get(category, name)
+    else:
+        tag = next(tio.tags.list(('category_name', 'eq', category),
+                                 ('value', 'eq', name),
+                                 limit=1), None)
     if tag:
         if delete_assignments:
             filters = {'and': [{'property': 'tags',
                                 'operator': 'eq',
                                 'value': [tag.get('uuid')]}]}
-            find_assets(tio, filters, _cb, tag.get('uuid'))
+            for _assets in iter_assets(tio, filters, pages=True,
+                                       prefetch=prefetch):
+                with stats.phase('tag writes'):
+                    _cb(tio, _assets, tag.get('uuid'))
         else:
             print(f'(!) Tag {category}:{name} already exists')
+    elif registry:
+        tag = registry.create(category, name)
     else:
         description = 'Created via API'
         tag = tio.tags.create(category, name, description=description,
@@ -149,55 +288,193 @@ def create_tag(tio, category, name, delete_assignments=False):
     return tag
 
 
+def sync_tag(tio, tag_id, tag_name, assets, prefetch=0, batch_size=1000):
+    # current members of the tag
+    filters = {'and': [{'property': 'tags',
+                        'operator': 'eq',
+                        'value': [tag_id]}]}
+    current = {}
+    for a in iter_assets(tio, filters, prefetch=prefetch):
+        current[a.get('id')] = a.get('name')
+
+    # send only the delta
+    to_add = [{'id': i, 'name': n} for i, n in assets.items()
+              if i not in current]
+    to_remove = [{'id': i, 'name': n} for i, n in current.items()
+                 if i not in assets]
+    print(f'(*) Tag "{tag_name}": {len(current)} assets tagged, {len(assets)} expected, {len(to_add)} to add, {len(to_remove)} to remove')  # noqa
+
+    with TagWriter(tio, tag_id, tag_name, 'assign', batch_size) as w:
+        w.add(to_add)
+    with TagWriter(tio, tag_id, tag_name, 'unassign', batch_size) as w:
+        w.add(to_remove)
+
+    return len(to_add), len(to_remove)
+
+
+class TagWriter:
+    def __init__(self, tio, tag_id, tag_name, action='assign',
+                 batch_size=1000, flush_interval=None):
+        if batch_size < 1:
+            raise ValueError('The batch size must be at least 1')
+        self.tio = tio
+        self.tag_id = tag_id
+        self.tag_name = tag_name
+        self.action = action
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.jobs = 0
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def pending(self):
+        return [{'id': i, 'name': n} for i, n in self._pending.items()]
+
+    def add(self, assets):
+        for a in assets:
+            self._pending[a.get('id')] = a.get('name')
+        if len(self._pending) >= self.batch_size:
+            self.flush(full_batches=True)
+        else:
+            self.tick()
+
+    def tick(self):
+        # to be called periodically, so that the pending assets are sent
+        # flush_interval seconds after the last flush even if no other
+        # asset is added
+        if (self.flush_interval is not None and self._pending and
+                time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self, full_batches=False):
+        with stats.phase('tag writes'):
+            self._flush(full_batches)
+
+    def _flush(self, full_batches):
+        self._last_flush = time.monotonic()
+        while self._pending:
+            if full_batches and len(self._pending) < self.batch_size:
+                break
+            # the batch stays pending until it has been written: if the
+            # request fails, it is still saved by a checkpoint
+            ids = list(self._pending)[:self.batch_size]
+            names = [self._pending[i] for i in ids]
+            if self.action == 'assign':
+                self.tio.tags.assign(ids, [self.tag_id])
+                print(f'(*) Tag "{self.tag_name}" has been assigned to {"|".join(names)}')  # noqa
+            else:
+                self.tio.tags.unassign(ids, [self.tag_id])
+                print(f'(*) Tag "{self.tag_name}" has been removed from {"|".join(names)}')  # noqa
+            for i in ids:
+                del self._pending[i]
+            self.written += len(ids)
+            self.jobs += 1
+
+
 #
 # Assets
 #
 
-def find_assets(tio, filters, cb, *args, **kwargs):
-    assets = []
+def iter_assets(tio, filters, pages=False, prefetch=0, limit=100,
+                **kwargs):
+    paginator = pagination.assets(tio, filters, limit=limit,
+                                  prefetch=prefetch, **kwargs)
+    if pages:
+        yield from paginator.pages()
+    else:
+        yield from paginator
+
 
-    limit = 100
-    sort = []
-    fields = []
-    pagination = None
-    token = None
-
-    # first call
-    res = tio.v3.explore.assets.search_all(filter=filters,
-                                           sort=sort,
-                                           fields=fields,
-                                           limit=limit,
-                                           return_resp=True)
-    data = json.loads(res.text)
-    _assets = data.get('assets', [])
-    if len(_assets) > 0:
+def find_assets(tio, filters, cb, *args, prefetch=0, **kwargs):
+    assets = []
+    for _assets in iter_assets(tio, filters, pages=True, prefetch=prefetch):
         if cb:
-            cb(tio, _assets, *args, **kwargs)
-        assets += _assets
-    pagination = data.get('pagination')
-    if pagination:
-        token = pagination.get('next')
-    else:
-        token = None
-
-    # get other pages of results (if any)
-    while token:
-        res = tio.v3.explore.assets.search_all(filter=filters,
-                                               sort=sort,
-                                               fields=fields,
-                                               limit=limit,
-                                               return_resp=True,
-                                               next=token)
-        data = json.loads(res.text)
-        _assets = data.get('assets', [])
-        if len(_assets) > 0:
-            if cb:
+            with stats.phase('callback'):
                 cb(tio, _assets, *args, **kwargs)
-            assets += _assets
-        pagination = data.get('pagination')
-        if pagination:
-            token = pagination.get('next')
-        else:
-            token = None
-
+        assets += _assets
     return assets
+
+
+class AssetIndex:
+    def __init__(self):
+        self.by_agent_uuid = {}
+        self.by_hostname = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @staticmethod
+    def _uuid(u):
+        return str(u).replace('-', '').lower()
+
+    @staticmethod
+    def _slim(asset):
+        return {
+            'id': asset.get('id'),
+            'name': asset.get('name'),
+            'host_name': asset.get('host_name'),
+            'agent_uuid': asset.get('agent_uuid'),
+            'last_observed': asset.get('last_observed')
+        }
+
+    def add(self, asset):
+        self.size += 1
+        entry = {'id': asset.get('id'), 'name': asset.get('name')}
+        agent_uuids = asset.get('agent_uuid') or []
+        if not isinstance(agent_uuids, list):
+            agent_uuids = [agent_uuids]
+        for u in agent_uuids:
+            self.by_agent_uuid[self._uuid(u)] = entry
+        names = set([asset.get('name'), asset.get('host_name')])
+        for n in names:
+            if n:
+                self.by_hostname.setdefault(n.lower(), []).append(entry)
+
+    def resolve(self, agent):
+        # the agent UUID is exact, the hostname is the fallback
+        u = agent.get('uuid')
+        if u and self._uuid(u) in self.by_agent_uuid:
+            return [self.by_agent_uuid[self._uuid(u)]]
+        name = agent.get('name')
+        if name:
+            return self.by_hostname.get(name.lower(), [])
+        return []
+
+    @classmethod
+    def from_agents_assets(cls, tio, page_size=1000, prefetch=0, cache=None):
+        index = cls()
+        filters = {'and': [{'property': 'sources',
+                            'operator': 'eq',
+                            'value': ['NESSUS_AGENT']}]}
+
+        def _fetch(f=filters):
+            for a in iter_assets(tio, f, prefetch=prefetch, limit=page_size):
+                yield cls._slim(a)
+
+        def _fetch_since(watermark):
+            f = {'and': filters['and'] + [{'property': 'last_observed',
+                                           'operator': 'gt',
+                                           'value': watermark}]}
+            return _fetch(f)
+
+        if cache:
+            assets = cache.read_through('agent_assets', _fetch, 'id',
+                                        fetch_since=_fetch_since,
+                                        watermark_of=lambda a: a.get('last_observed'))  # noqa
+        else:
+            assets = _fetch()
+        for a in assets:
+            index.add(a)
+        print(f'(*) Indexed {len(index)} agent assets')
+        return index
@@ -0,0 +1,393 @@
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+
+from tenable_helpers import cli, commons, stats, throttle
+from tenable_helpers.cache import Cache
+
+LOG = logging.getLogger(__name__)
+
+# job keys whose value can be a file (@file)
+FILE_KEYS = ['rules', 'filters', 'description', 'conditions']
+
+
+class Daemon:
+    def __init__(self, tio, max_jobs=8, cache=None):
+        self.tio = tio
+        self.cache = cache or Cache(':memory:')
+        self.started = time.time()
+        self.jobs = {'running': 0, 'done': 0, 'failed': 0}
+        self._slots = threading.BoundedSemaphore(max_jobs)
+        self._lock = threading.Lock()
+        # warm state: name -> (value, built at)
+        self._warm = {}
+        self._builds = {'registry': threading.Lock(),
+                        'index': threading.Lock()}
+
+    #
+    # Warm state (shared by all the jobs)
+    #
+
+    def _get_warm(self, name, ttl, build):
+        # built (one at a time) outside of self._lock, so that health checks
+        # and the other jobs are not blocked by the API calls; while it is
+        # rebuilt, the expired value is still served
+        with self._lock:
+            value, built = self._warm.get(name, (None, 0))
+        if value is not None and time.time() - built <= ttl:
+            return value
+        if not self._builds[name].acquire(blocking=value is None):
+            return value
+        try:
+            with self._lock:
+                value, built = self._warm.get(name, (None, 0))
+            if value is None or time.time() - built > ttl:
+                value = build()
+                with self._lock:
+                    self._warm[name] = (value, time.time())
+            return value
+        finally:
+            self._builds[name].release()
+
+    @property
+    def registry(self):
+        # rebuilt after its TTL (tags may be deleted or created again)
+        return self._get_warm(
+            'registry', self.cache.ttl['tags'],
+            lambda: commons.TagRegistry(self.tio, cache=self.cache))
+
+    def index(self, prefetch=0):
+        # rebuilt (incrementally, through the cache) after its TTL
+        return self._get_warm(
+            'index', self.cache.ttl['agent_assets'],
+            lambda: commons.AssetIndex.from_agents_assets(
+                self.tio, prefetch=prefetch, cache=self.cache))
+
+    def status(self):
+        with self._lock:
+            registry = self._warm.get('registry', (None, 0))[0]
+            return {
+                'uptime': int(time.time() - self.started),
+                'jobs': dict(self.jobs),
+                'tags': len(registry) if registry else 0,
+                'index': 'index' in self._warm
+            }
+
+    #
+    # Jobs
+    #
+
+    def po2tag(self, job):
+        from tenable_helpers.scripts import tio_po2tag
+        filters, rules = tio_po2tag.load_rules(json.dumps(job))
+        if not filters or not rules:
+            raise ValueError('filters and rules must be defined')
+        if not isinstance(filters, dict):
+            raise ValueError('filters must be an object')
+        prefetch = job.get('prefetch', 0)
+        tio_po2tag.create_tags(self.tio, rules, prefetch=prefetch,
+                               registry=self.registry)
+        seen = tio_po2tag.find_assets_and_assign_tags(
+            self.tio, filters, rules,
+            page_size=job.get('page_size', 100),
+            prefetch=prefetch,
+            batch_size=job.get('batch_size', 1000),
+            workers=job.get('workers', 1),
+            backend=job.get('backend', 'search'),
+            # forking a threaded server may deadlock the workers
+            mp_context=multiprocessing.get_context('spawn'))
+        return {r.tag_name: len(s) for r, s in zip(rules, seen)}
+
+    def group2tag(self, job):
+        from tenable_helpers.scripts import tio_group2tag
+        groups = commons.get_agent_groups(self.tio, self.cache)
+        if job.get('match'):
+            try:
+                p = re.compile(job['match'], re.IGNORECASE)
+            except (re.error, TypeError) as e:
+                raise ValueError(f'Invalid match: {e}')
+            groups = [g for g in groups if p.search(g.get('name', ''))]
+        elif not job.get('all_groups'):
+            wanted = {str(g) for g in job.get('groups', [])}
+            groups = [g for g in groups
+                      if g.get('name') in wanted or str(g.get('id')) in wanted]
+        if not groups:
+            raise ValueError('No agent group has been selected')
+
+        prefetch = job.get('prefetch', 0)
+        registry = self.registry
+        registry.create_many([('AgentGroup', g.get('name')) for g in groups])
+        results, failures = tio_group2tag.groups2tags(
+            self.tio, groups, job.get('workers', 4),
+            page_size=job.get('page_size', 100),
+            prefetch=prefetch,
+            sync=job.get('sync', False),
+            batch_size=job.get('batch_size', 1000),
+            index=self.index(prefetch),
+            registry=registry)
+        return {
+            'tagged': results,
+            'failed': {k: str(e) for k, e in failures.items()}
+        }
+
+    def create_rg(self, job):
+        from tenable_helpers.scripts import tio_create_rg
+        for k in ('name', 'conditions', 'start_date', 'due_date'):
+            if not job.get(k):
+                raise ValueError(f'{k} must be defined')
+        conditions = job.get('conditions')
+        if not isinstance(conditions, str):
+            conditions = json.dumps(conditions)
+        conf = tio_create_rg.build_goal(job.get('name'),
+                                        job.get('description', ''),
+                                        conditions,
+                                        job.get('start_date'),
+                                        job.get('due_date'))
+        goals = tio_create_rg.create_goal(self.tio, conf)
+        return [{'name': g.get('name'), 'goaluuid': g.get('goaluuid')}
+                for g in goals]
+
+    def list_networks(self, job):
+        from tenable_helpers.scripts import tio_list_networks
+        networks = self.tio.networks.list(
+            include_deleted=job.get('include_deleted', True))
+        if job.get('enrich'):
+            networks = tio_list_networks.enrich(
+                self.tio, networks, job.get('workers', 8),
+                job.get('not_seen_days', 30))
+        return list(networks)
+
+    def run(self, kind, job, files=False):
+        # files: the job comes from a local job file and may read files
+        # (@file), a job posted to the HTTP API can't
+        func = JOBS.get(kind)
+        if func is None:
+            raise KeyError(kind)
+        with self._slots:
+            with self._lock:
+                self.jobs['running'] += 1
+            try:
+                start = time.monotonic()
+                check_job(job, files)
+                result = func(self, job)
+                print(f'(*) Job {kind} done in {time.monotonic() - start:.2f}s')  # noqa
+            except Exception:
+                with self._lock:
+                    self.jobs['failed'] += 1
+                raise
+            else:
+                with self._lock:
+                    self.jobs['done'] += 1
+            finally:
+                with self._lock:
+                    self.jobs['running'] -= 1
+        return result
+
+
+def check_job(job, files=False):
+    # what all the jobs have in common, the rest is checked by each job:
+    # a malformed job raises ValueError
+    if not isinstance(job, dict):
+        raise ValueError('A job must be an object')
+    for k in FILE_KEYS:
+        v = job.get(k)
+        if not files and isinstance(v, str) and v.startswith('@'):
+            raise ValueError(f'{k}: files can only be read by the jobs of a job file')  # noqa
+    for k in ('page_size', 'batch_size', 'workers', 'prefetch'):
+        v = job.get(k)
+        if v is None:
+            continue
+        if not isinstance(v, int) or isinstance(v, bool) or v < 0 or (
+                v == 0 and k != 'prefetch'):
+            raise ValueError(f'{k} must be a positive integer')
+    if job.get('backend', 'search') not in ('search', 'export'):
+        raise ValueError(f'Unknown backend: {job.get("backend")}')
+
+
+JOBS = {
+    'po2tag': Daemon.po2tag,
+    'group2tag': Daemon.group2tag,
+    'create-rg': Daemon.create_rg,
+    'list-networks': Daemon.list_networks,
+}
+
+
+#
+# HTTP API
+#
+
+class Handler(BaseHTTPRequestHandler):
+    def address_string(self):
+        # no client address on a Unix socket
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def _send(self, code, data):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _host(self):
+        host = (self.headers.get('Host') or '').lower()
+        if host.startswith('['):
+            return host[1:].partition(']')[0]
+        return host.rpartition(':')[0] if ':' in host else host
+
+    def _check(self):
+        # the Host header protects from DNS rebinding, the token from any
+        # other local user (or web page) sending requests
+        hosts = self.server.allowed_hosts
+        if hosts is not None and self._host() not in hosts:
+            self._send(400, {'error': 'Invalid Host header'})
+            return False
+        token = self.server.token
+        if token:
+            auth = self.headers.get('Authorization') or ''
+            if not hmac.compare_digest(auth.encode(),
+                                       f'Bearer {token}'.encode()):
+                self._send(401, {'error': 'Invalid or missing token'})
+                return False
+        return True
+
+    def do_GET(self):
+        if not self._check():
+            return
+        if self.path == '/health':
+            return self._send(200, self.server.app.status())
+        self._send(404, {'error': f'{self.path} not found'})
+
+    def do_POST(self):
+        if not self._check():
+            return
+        kind = self.path[len('/jobs/'):]
+        if not self.path.startswith('/jobs/') or kind not in JOBS:
+            return self._send(404, {'error': f'{self.path} not found'})
+        ctype = self.headers.get('Content-Type') or ''
+        if ctype.split(';')[0].strip().lower() != 'application/json':
+            return self._send(415, {'error': 'Jobs must be posted as application/json'})  # noqa
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            job = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            return self._send(400, {'error': f'Invalid job: {e}'})
+        try:
+            result = self.server.app.run(kind, job)
+        except ValueError as e:
+            return self._send(400, {'error': str(e)})
+        except Exception as e:
+            LOG.exception(f'Job {kind} failed')
+            return self._send(500, {'error': str(e)})
+        self._send(200, {'result': result})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn,
+                     socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(daemon, host='127.0.0.1', port=8765, socket_path=None,
+                token=None):
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = UnixHTTPServer(socket_path, Handler)
+        os.chmod(socket_path, 0o600)
+        server.allowed_hosts = None
+    else:
+        if not token:
+            raise ValueError('A token is required to serve on TCP')
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.allowed_hosts = {host.lower(), 'localhost', '127.0.0.1', '::1'}
+        if host in ('', '0.0.0.0', '::'):
+            # any address: only the token is checked
+            server.allowed_hosts = None
+    server.app = daemon
+    server.token = token
+    return server
+
+
+@click.command()
+@click.option('--host', 'host', default='127.0.0.1',
+              help='Address of the HTTP API')
+@click.option('--port', 'port', default=8765, type=int,
+              help='Port of the HTTP API')
+@click.option('--socket', 'socket_path', default=None,
+              help='Serve the HTTP API on this Unix socket instead')
+@click.option('--token', 'token', default=None, envvar='TIO_HELPERS_TOKEN',
+              help='Token the clients must send as "Authorization: Bearer '
+                   '<token>" (required on TCP)')
+@click.option('--max-jobs', 'max_jobs', default=8, type=int,
+              help='Number of jobs run concurrently')
+@click.option('--cache', 'use_cache', is_flag=True,
+              help='Keep the warm data in the local cache across restarts')
+@throttle.options
+@stats.options
+def serve(host, port, socket_path, token, max_jobs, use_cache, read_rate,
+          write_rate):
+    # check credentials
+    access_key, secret_key = cli.get_keys()
+    if not access_key:
+        print('(!) ACCESS_KEY must be defined')
+        sys.exit(1)
+
+    if not secret_key:
+        print('(!) SECRET_KEY must be defined')
+        sys.exit(1)
+
+    if not (socket_path or token):
+        print('(!) --token (or TIO_HELPERS_TOKEN) must be defined to serve on TCP')  # noqa
+        sys.exit(1)
+
+    # init the API (one session shared by all the jobs)
+    from tenable.io import TenableIO
+    tio = TenableIO(access_key, secret_key)
+    throttle.install(tio, read_rate=read_rate, write_rate=write_rate)
+    stats.install(tio)
+
+    daemon = Daemon(tio, max_jobs, Cache() if use_cache else None)
+    server = make_server(daemon, host, port, socket_path, token)
+    where = socket_path or f'http://{host}:{port}'
+    print(f'(*) Listening on {where} (jobs: {", ".join(JOBS)})')
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
@@ -0,0 +1,105 @@
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import functools
+import io
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:  # optional dependency (pip install tenable_helpers[fast])
+    orjson = None
+
+LOG = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def _ijson():
+    # imported on first use: only the streaming mode needs it
+    try:
+        import ijson
+    except ImportError:  # optional (pip install tenable_helpers[fast])
+        return None
+    return ijson
+
+
+def backend():
+    return 'orjson' if orjson else 'json'
+
+
+def loads(data):
+    # parse straight from the raw bytes (no bytes -> str copy)
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def can_stream():
+    return _ijson() is not None
+
+
+def iter_items(data, key):
+    # decode the items of data[key] one at a time: only the current item
+    # is materialized
+    ijson = _ijson()
+    if ijson is None:
+        yield from loads(data).get(key) or []
+        return
+    yield from ijson.items(io.BytesIO(data), f'{key}.item', use_float=True)
+
+
+def _pagination(data):
+    # the API puts the pagination after the items: parse only the tail of
+    # the body instead of a second pass over it (a quote can't be followed
+    # by another one in a JSON string, so this is the key of an object)
+    i = data.rfind(b'"pagination"')
+    if i < 0:
+        return None
+    try:
+        doc = loads(b'{' + data[i:])
+    except ValueError:
+        doc = None
+    if isinstance(doc, dict) and isinstance(doc.get('pagination'), dict):
+        return doc['pagination']
+    # somewhere else: scan until found
+    return next(_ijson().items(io.BytesIO(data), 'pagination'), None)
+
+
+def page(res, key, stream=False):
+    data = res.content
+    ijson = _ijson() if stream else None
+    if ijson is not None:
+        pagination = _pagination(data)
+        items = iter_items(data, key)
+    else:
+        doc = loads(data)
+        pagination = doc.get('pagination')
+        items = doc.get(key) or []
+    token = pagination.get('next') if pagination else None
+    return items, token
+
+
+def chunk(res, stream=False):
+    # export chunks are plain JSON lists
+    data = res.content
+    ijson = _ijson() if stream else None
+    if ijson is not None:
+        return ijson.items(io.BytesIO(data), 'item', use_float=True)
+    return loads(data)
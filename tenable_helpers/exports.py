@@ -0,0 +1,121 @@
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from tenable_helpers import decoding, stats
+
+LOG = logging.getLogger(__name__)
+
+SEVERITIES = ['info', 'low', 'medium', 'high', 'critical']
+
+
+def vuln_filters(filters):
+    # translate (the subset of) v3 explore findings filters that the
+    # vulnerability export understands: anything else is an error, an
+    # export without filters would read every vulnerability of the tenant
+    hint = 'use --export-filters to define the export filters'
+    if not filters or set(filters) != {'and'}:
+        raise ValueError(f'Only "and" filters can be translated to export filters, {hint}')  # noqa
+    f = {}
+    for c in filters.get('and'):
+        prop = c.get('property')
+        op = c.get('operator')
+        value = c.get('value')
+        if not isinstance(value, list):
+            value = [value]
+        try:
+            if prop == 'definition.id' and op == 'eq':
+                f['plugin_id'] = [int(v) for v in value]
+            elif prop == 'severity' and op == 'eq':
+                if not all(0 <= int(v) < len(SEVERITIES) for v in value):
+                    raise ValueError(f'Invalid severity {value}')
+                f['severity'] = [SEVERITIES[int(v)] for v in value]
+            elif prop == 'state' and op == 'eq':
+                f['state'] = [str(v).lower() for v in value]
+            else:
+                raise ValueError(f'Filter "{prop} {op}" is not supported by the export')  # noqa
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'{e}, {hint}')
+    if not f:
+        raise ValueError(f'No export filter has been defined, {hint}')
+    return f
+
+
+def _finding(vuln):
+    asset = vuln.get('asset', {})
+    return {
+        'asset': {
+            'id': asset.get('uuid'),
+            'name': asset.get('hostname') or asset.get('fqdn')
+        },
+        'output': vuln.get('output') or ''
+    }
+
+
+def _download_chunk(tio, export_uuid, chunk_id, stream=False):
+    res = tio.get(f'vulns/export/{export_uuid}/chunks/{chunk_id}')
+    with stats.phase('decode'):
+        findings = [_finding(v) for v in decoding.chunk(res, stream=stream)]
+    stats.count('export chunks')
+    return findings
+
+
+def iter_vuln_chunks(tio, filters, workers=4, num_assets=500,
+                     poll_interval=5, stream=False):
+    payload = {'num_assets': num_assets, 'filters': filters}
+    res = tio.post('vulns/export', json=payload)
+    export_uuid = res.json().get('export_uuid')
+    print(f'(*) Vulnerability export "{export_uuid}" has been requested')
+
+    submitted = set()
+    pending = set()
+    finished = False
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            # download the chunks as soon as they are available
+            if not finished:
+                status = tio.get(f'vulns/export/{export_uuid}/status').json()
+                state = status.get('status')
+                if state in ('ERROR', 'CANCELLED'):
+                    raise RuntimeError(f'Vulnerability export {export_uuid} status is {state}')  # noqa
+                for c in status.get('chunks_available', []):
+                    if c not in submitted:
+                        submitted.add(c)
+                        pending.add(pool.submit(_download_chunk, tio,
+                                                export_uuid, c, stream))
+                finished = state == 'FINISHED'
+
+            if not pending:
+                if finished:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            timeout = None if finished else poll_interval
+            done, pending = wait(pending, timeout=timeout,
+                                 return_when=FIRST_COMPLETED)
+            for d in done:
+                findings = d.result()
+                LOG.debug(f'Got chunk with {len(findings)} findings')
+                yield findings
+
+    print(f'(*) Vulnerability export "{export_uuid}": downloaded {len(submitted)} chunks')  # noqa
@@ -0,0 +1,214 @@
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import itertools
+import logging
+import queue
+import threading
+import time
+
+from tenable_helpers import decoding, stats
+
+LOG = logging.getLogger(__name__)
+
+
+def _iter_pages(fetch, prefetch=0, token=None):
+    # yields (page, token of the next page)
+    # no prefetch: fetch the next page only when the caller asks for it
+    if prefetch < 1:
+        while True:
+            page, token = fetch(token)
+            yield page, token
+            if not token:
+                return
+
+    # prefetch: a background worker keeps up to "prefetch" pages ready
+    # while the caller is still handling the current one
+    pages = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    done = object()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _worker(token):
+        try:
+            while not stop.is_set():
+                page, token = fetch(token)
+                if not _put((page, token)) or not token:
+                    break
+        except Exception as e:
+            _put(e)
+        _put(done)
+
+    worker = threading.Thread(target=_worker, args=(token,), daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = pages.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        worker.join()
+
+
+class Paginator:
+    def __init__(self, fetch, limit=100, prefetch=0, max_results=None,
+                 timing=False, name='results', token=None):
+        self._fetch = fetch
+        self.limit = limit
+        self.prefetch = prefetch
+        self.max_results = max_results
+        self.timing = timing
+        self.name = name
+        # first page (None) or the one a resumed run starts from
+        self.start_token = token
+        # token of the page after the last yielded one
+        self.token = token
+
+        # counters of the last run
+        self.pages_fetched = 0
+        self.results = 0
+        self.timings = []
+        self._fetched = 0
+
+    def _fetch_page(self, token):
+        limit = self.limit
+        if self.max_results is not None:
+            limit = max(1, min(limit, self.max_results - self._fetched))
+        start = time.monotonic()
+        items, token = self._fetch(limit, token)
+        elapsed = time.monotonic() - start
+        stats.count('pages')
+        if isinstance(items, list):
+            stats.count(f'{self.name} fetched', len(items))
+            self._fetched += len(items)
+        else:
+            # streamed page: the size is only known once consumed, assume
+            # a full one
+            self._fetched += limit
+        if self.max_results is not None and self._fetched >= self.max_results:
+            token = None
+        self.timings.append(elapsed)
+        if self.timing and isinstance(items, list):
+            print(f'(*) Page {len(self.timings)}: got {len(items)} {self.name} in {elapsed:.2f}s')  # noqa
+        elif self.timing:
+            print(f'(*) Page {len(self.timings)}: fetched in {elapsed:.2f}s')
+        return items, token
+
+    def pages(self):
+        self.pages_fetched = 0
+        self.results = 0
+        self.timings = []
+        self._fetched = 0
+        pages = _iter_pages(self._fetch_page, self.prefetch, self.start_token)
+        try:
+            for items, token in pages:
+                self.pages_fetched += 1
+                self.token = token
+                if not isinstance(items, list):
+                    yield self._stream(items)
+                else:
+                    if self.max_results is not None:
+                        items = items[:self.max_results - self.results]
+                    if len(items) > 0:
+                        self.results += len(items)
+                        yield items
+                if (self.max_results is not None
+                        and self.results >= self.max_results):
+                    return
+        finally:
+            pages.close()
+
+    def _stream(self, items):
+        if self.max_results is not None:
+            items = itertools.islice(items, self.max_results - self.results)
+        for item in items:
+            self.results += 1
+            stats.count(f'{self.name} fetched')
+            yield item
+
+    def __iter__(self):
+        for items in self.pages():
+            yield from items
+
+
+def _decode(res, key, stream=False):
+    with stats.phase('decode'):
+        return decoding.page(res, key, stream=stream)
+
+
+def explore(search, key, filters, sort=None, fields=None, stream=False,
+            **kwargs):
+    sort = sort or []
+    fields = fields or []
+
+    def _fetch(limit, token):
+        params = {}
+        if token:
+            params['next'] = token
+        res = search(filter=filters,
+                     sort=sort,
+                     fields=fields,
+                     limit=limit,
+                     return_resp=True,
+                     **params)
+        return _decode(res, key, stream=stream)
+
+    kwargs.setdefault('name', key)
+    return Paginator(_fetch, **kwargs)
+
+
+def assets(tio, filters, **kwargs):
+    return explore(tio.v3.explore.assets.search_all, 'assets', filters,
+                   **kwargs)
+
+
+def findings(tio, filters, **kwargs):
+    return explore(tio.v3.explore.findings.search_host, 'findings', filters,
+                   **kwargs)
+
+
+def goals(api, filters, sort=None, **kwargs):
+    path = 'remediation/goal/search'
+    sort = sort or []
+
+    def _fetch(limit, token):
+        payload = {
+            'filter': filters,
+            'limit': limit,
+            'next': token,
+            'sort': sort
+        }
+        res = api.post(path, json=payload)
+        return _decode(res, 'goals')
+
+    kwargs.setdefault('limit', 200)
+    kwargs.setdefault('name', 'goals')
+    return Paginator(_fetch, **kwargs)
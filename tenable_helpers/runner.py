@@ -0,0 +1,288 @@
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import datetime
+import json
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import click
+
+from tenable_helpers import agents, cli, commons, stats, throttle
+from tenable_helpers.daemon import FILE_KEYS, JOBS, Daemon
+
+# job types whose reads can be shared with other jobs
+SHARED = ['po2tag', 'agents-info']
+
+
+def load_jobs(path):
+    with open(path, 'r') as fp:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:  # optional (pip install tenable_helpers[jobs])
+                raise ValueError('PyYAML is required to read YAML job files')
+            data = yaml.safe_load(fp)
+        else:
+            data = json.load(fp)
+    # requests per second of the API session (0: no limit)
+    rates = (data.get('options') or {}).get('rates') or {}
+    for k, v in rates.items():
+        if k not in ('read', 'write'):
+            raise ValueError(f'Unknown rate: {k} (use read or write)')
+        if not isinstance(v, (int, float)) or isinstance(v, bool) or v < 0:
+            raise ValueError(f'The {k} rate must be a number from 0')
+    jobs = data.get('jobs') or []
+    base = os.path.dirname(os.path.abspath(path))
+    names = set()
+    for i, job in enumerate(jobs):
+        job.setdefault('name', f'{job.get("type")}-{i + 1}')
+        if job.get('type') not in SHARED and job.get('type') not in JOBS:
+            raise ValueError(f'Job "{job["name"]}" has an unknown type: {job.get("type")}')  # noqa
+        if job['name'] in names:
+            raise ValueError(f'Job "{job["name"]}" is defined more than once')
+        names.add(job['name'])
+        # @file values are relative to the job file
+        for k in FILE_KEYS:
+            v = job.get(k)
+            if isinstance(v, str) and v.startswith('@'):
+                job[k] = '@' + os.path.normpath(
+                    os.path.join(base, os.path.expanduser(v[1:])))
+    return data, jobs
+
+
+def _rules(job):
+    # rules of a po2tag job: inline, or from a rules file (@file)
+    from tenable_helpers.scripts import tio_po2tag
+    if isinstance(job.get('rules'), str):
+        filters, rules = tio_po2tag.load_rules(job['rules'])
+    else:
+        filters, rules = tio_po2tag.load_rules(json.dumps(job))
+    if isinstance(job.get('filters'), str):
+        filters = commons.str_to_json(job['filters'])
+    elif job.get('filters'):
+        filters = job['filters']
+    if not filters or not rules:
+        raise ValueError(f'Job "{job["name"]}": filters and rules must be defined')  # noqa
+    return filters, rules
+
+
+def plan(jobs):
+    # one unit of work for each distinct read: po2tag jobs with the same
+    # filters share a single scan of the findings, agents-info jobs a single
+    # agents listing; any other job is a unit of its own
+    scans = OrderedDict()
+    agents_jobs = []
+    units = []
+    for job in jobs:
+        if job['type'] == 'po2tag':
+            try:
+                filters, rules = _rules(job)
+            except ValueError as e:
+                # only this job fails
+                units.append(('invalid', [(job, e)]))
+                continue
+            key = json.dumps(filters, sort_keys=True)
+            scans.setdefault(key, (filters, []))[1].append((job, rules))
+        elif job['type'] == 'agents-info':
+            agents_jobs.append(job)
+        else:
+            units.append((job['type'], [job]))
+    for filters, consumers in scans.values():
+        units.append(('po2tag', (filters, consumers)))
+    if agents_jobs:
+        units.append(('agents-info', agents_jobs))
+    return units
+
+
+def _run_po2tag(daemon, filters, consumers, options):
+    from tenable_helpers.scripts import tio_po2tag
+    rules = [r for _, rs in consumers for r in rs]
+    tio_po2tag.create_tags(daemon.tio, rules,
+                           prefetch=options.get('prefetch', 0),
+                           registry=daemon.registry)
+    seen = tio_po2tag.find_assets_and_assign_tags(
+        daemon.tio, filters, rules,
+        page_size=options.get('page_size', 100),
+        prefetch=options.get('prefetch', 0),
+        batch_size=options.get('batch_size', 1000),
+        backend=options.get('backend', 'search'))
+    results = {}
+    i = 0
+    for job, rs in consumers:
+        results[job['name']] = {r.tag_name: len(s)
+                                for r, s in zip(rs, seen[i:i + len(rs)])}
+        i += len(rs)
+    return results
+
+
+def _find_group(agent_groups, group):
+    for g in agent_groups:
+        if str(group).lower() in (str(g['id']), g['name'].lower()):
+            return g
+    raise ValueError(f'Unable to find agent group {group}')
+
+
+def _agents_info(job, fleet, agent_groups, now):
+    names = job.get('reports') or list(agents.REPORTS)
+    for n in names:
+        if n not in agents.REPORTS:
+            raise ValueError(f'Unknown report: {n}')
+    stale_days = job.get('stale_days', 7)
+
+    if job.get('all_groups'):
+        health = agents.group_health(fleet, names, stale_days=stale_days)
+        out_file = f'{job["name"]}.health.{now}.csv'
+        rows = agents.save_health(health, names, agent_groups, out_file)
+        return {'groups': len(rows), 'file': out_file}
+
+    g = _find_group(agent_groups, job.get('group'))
+    members = (a for a in fleet if g['id'] in a.groups)
+    results = agents.run_reports(members, names, stale_days=stale_days)
+    agents.save_reports(results, g['id'], now)
+    return {n: len(rows) for n, (headline, rows) in results.items()}
+
+
+def _run_agents_info(daemon, jobs, workers=4):
+    now = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+    agent_groups = commons.get_agent_groups(daemon.tio, daemon.cache)
+
+    # a single listing: filtered for a lone single-group job, the whole
+    # fleet (kept as compact Agent objects) otherwise
+    filters = []
+    if len(jobs) == 1 and not jobs[0].get('all_groups'):
+        g = _find_group(agent_groups, jobs[0].get('group'))
+        filters = [('groups', 'eq', g['id'])]
+    with stats.phase('agents'):
+        fleet = [agents.Agent.from_dict(a)
+                 for a in agents.iter_agents(daemon.tio, *filters,
+                                             workers=workers)]
+
+    results = {}
+    for job in jobs:
+        try:
+            results[job['name']] = _agents_info(job, fleet, agent_groups, now)
+        except Exception as e:
+            results[job['name']] = e
+    return results
+
+
+def run_unit(daemon, unit, options):
+    kind, payload = unit
+    if kind == 'invalid':
+        raise payload[0][1]
+    if kind == 'po2tag':
+        return _run_po2tag(daemon, *payload, options)
+    if kind == 'agents-info':
+        return _run_agents_info(daemon, payload)
+    job = payload[0]
+    return {job['name']: daemon.run(kind, job, files=True)}
+
+
+def run(daemon, units, workers=4, options=None):
+    # independent units run concurrently, all of them through the same API
+    # session and rate limiter
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_unit, daemon, u, options or {}): u
+                   for u in units}
+        for f in as_completed(futures):
+            kind, payload = futures[f]
+            try:
+                results.update(f.result())
+            except Exception as e:
+                for name in _names(kind, payload):
+                    results[name] = e
+    return results
+
+
+def _names(kind, payload):
+    if kind == 'po2tag':
+        return [job['name'] for job, _ in payload[1]]
+    if kind == 'invalid':
+        return [job['name'] for job, _ in payload]
+    return [job['name'] for job in payload]
+
+
+@click.command()
+@click.argument('job_file')
+@click.option('--workers', 'workers', default=None, type=int,
+              help='Number of units of work run concurrently')
+@click.option('--dry-run', 'dry_run', is_flag=True,
+              help='Only print the plan')
+@throttle.options
+@stats.options
+def tio_run(job_file, workers, dry_run, read_rate, write_rate):
+    # load and plan the jobs
+    try:
+        data, jobs = load_jobs(job_file)
+        units = plan(jobs)
+    except Exception as e:
+        print(f'(!) Error: {e}')
+        sys.exit(1)
+
+    work = [u for u in units if u[0] != 'invalid']
+    print(f'(*) {len(jobs)} jobs, {len(work)} units of work')
+    for kind, payload in units:
+        if kind == 'invalid':
+            for job, e in payload:
+                print(f'(!) Job "{job["name"]}" ({job["type"]}) is invalid: {e}')  # noqa
+        else:
+            print(f'(*) {kind}: {", ".join(_names(kind, payload))}')
+    if dry_run:
+        return
+
+    # check credentials
+    access_key, secret_key = cli.get_keys()
+    if not access_key:
+        print('(!) ACCESS_KEY must be defined')
+        sys.exit(1)
+
+    if not secret_key:
+        print('(!) SECRET_KEY must be defined')
+        sys.exit(1)
+
+    # init the API
+    from tenable.io import TenableIO
+    tio = TenableIO(access_key, secret_key)
+    # the options override the rates of the job file
+    rates = (data.get('options') or {}).get('rates') or {}
+    if read_rate is None:
+        read_rate = rates.get('read')
+    if write_rate is None:
+        write_rate = rates.get('write')
+    throttle.install(tio, read_rate=read_rate, write_rate=write_rate)
+    stats.install(tio)
+
+    workers = workers or data.get('workers', 4)
+    daemon = Daemon(tio, max_jobs=workers)
+    results = run(daemon, units, workers, data.get('options'))
+
+    failed = 0
+    for job in jobs:
+        r = results.get(job['name'])
+        if isinstance(r, Exception):
+            failed += 1
+            print(f'(!) Job "{job["name"]}" ({job["type"]}) failed: {r}')
+        else:
+            print(f'(*) Job "{job["name"]}" ({job["type"]}): {json.dumps(r)}')  # noqa
+    if failed:
+        sys.exit(1)
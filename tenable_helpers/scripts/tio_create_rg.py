@@ -23,41 +23,23 @@ import sys
 from datetime import datetime as dt
 
 import click
-from tenable.io import TenableIO
-from tenable.io.base import TIOEndpoint
 
-from tenable_helpers import commons
+from tenable_helpers import cli, commons, pagination, stats, throttle
 
-try:
-    from keys import ACCESS_KEY, SECRET_KEY
-except Exception as e:  # noqa
-    ACCESS_KEY = os.getenv('ACCESS_KEY')
-    SECRET_KEY = os.getenv('SECRET_KEY')
 
+class RemediationGoalsAPI:
+    def __init__(self, api):
+        self._api = api
 
-class RemediationGoalsAPI(TIOEndpoint):
     def search(self, filters, *args, **kwargs):
-        path = 'remediation/goal/search'
-        payload = {
-            'filter': filters,
-            'limit': 200,
-            'next': None,
-            'sort': [{'property': 'name', 'order': 'desc'}]
-        }
-        res = self._api.post(path, json=payload)
-        return res.json().get('goals', [])
+        sort = [{'property': 'name', 'order': 'desc'}]
+        return list(pagination.goals(self._api, filters, sort=sort, **kwargs))
 
     def create(self, conf, *args, **kwargs):
         path = 'remediation/goal'
         self._api.post(path, json=conf)
 
 
-class TenableIOExtended(TenableIO):
-    @property
-    def remediation_goals(self):
-        return RemediationGoalsAPI(self)
-
-
 def build_description(desc_str):
     d = ''
     if desc_str.startswith('@'):
@@ -76,6 +58,39 @@ def build_description(desc_str):
     return d + '\n\nNote: created via API'
 
 
+def build_goal(g_name, g_desc, g_cond, g_sd, g_dd):
+    description = build_description(g_desc)
+    fmt_1 = '%Y-%m-%d'
+    fmt_2 = fmt_1 + 'T%H:%M:%S.000Z'
+    startdate = int(dt.strptime(g_sd, fmt_1).timestamp())
+    duedate = int(dt.strptime(g_dd, fmt_1).timestamp())
+    goalduedate = dt.strptime(g_dd, fmt_1).strftime(fmt_2)
+    conditions = json.dumps(commons.str_to_json(g_cond))
+    return {
+        'name': g_name,
+        'description': description,
+        'findingfilters': conditions,
+        'type': 'Static',
+        'status': 'ACTIVE',
+        'startdate': startdate,
+        'duedate': duedate,
+        'goalduedate': {
+            'name': 'byFixedDate',
+            'value': goalduedate
+        }
+    }
+
+
+def create_goal(tio, conf):
+    remediation_goals = RemediationGoalsAPI(tio)
+    remediation_goals.create(conf)
+    return remediation_goals.search({
+        'and': [
+            {'property': 'name', 'operator': 'eq', 'value': conf['name']}
+        ]
+    })
+
+
 @click.command()
 @click.option('-n', '--name', 'g_name', default=None, required=True,
               help='Name of the remediation goal')
@@ -87,53 +102,32 @@ def build_description(desc_str):
               help='Start date of the remediation goal (YYYY-MM-DD)')
 @click.option('-D', '--due-date', 'g_dd', default=None, required=True,
               help='Due date of the remediation goal (YYYY-MM-DD)')
-def tio_create_rg(g_name, g_desc, g_cond, g_sd, g_dd):
+@throttle.options
+@stats.options
+def tio_create_rg(g_name, g_desc, g_cond, g_sd, g_dd, read_rate, write_rate):
     # check credentials
-    if not ACCESS_KEY:
+    access_key, secret_key = cli.get_keys()
+    if not access_key:
         print('(!) ACCESS_KEY must be defined')
         sys.exit(1)
 
-    if not SECRET_KEY:
+    if not secret_key:
         print('(!) SECRET_KEY must be defined')
         sys.exit(1)
 
     # parse inpupt parameters
     try:
-        description = build_description(g_desc)
-        fmt_1 = '%Y-%m-%d'
-        fmt_2 = fmt_1 + 'T%H:%M:%S.000Z'
-        startdate = int(dt.strptime(g_sd, fmt_1).timestamp())
-        duedate = int(dt.strptime(g_dd, fmt_1).timestamp())
-        goalduedate = dt.strptime(g_dd, fmt_1).strftime(fmt_2)
-        conditions = json.dumps(commons.str_to_json(g_cond))
+        conf = build_goal(g_name, g_desc, g_cond, g_sd, g_dd)
     except Exception as e:
         print(f'(!) Error: {e}')
         sys.exit(1)
 
     # init the API
-    tio = TenableIOExtended(ACCESS_KEY, SECRET_KEY)
+    from tenable.io import TenableIO
+    tio = TenableIO(access_key, secret_key)
+    throttle.install(tio, read_rate=read_rate, write_rate=write_rate)
+    stats.install(tio)
 
-    # create remediation goal
-    conf = {
-        'name': g_name,
-        'description': description,
-        'findingfilters': conditions,
-        'type': 'Static',
-        'status': 'ACTIVE',
-        'startdate': startdate,
-        'duedate': duedate,
-        'goalduedate': {
-            'name': 'byFixedDate',
-            'value': goalduedate
-        }
-    }
-    tio.remediation_goals.create(conf)
-
-    # get details
-    goals = tio.remediation_goals.search({
-        'and': [
-            {'property': 'name', 'operator': 'eq', 'value': g_name}
-        ]
-    })
-    for g in goals:
+    # create remediation goal and get details
+    for g in create_goal(tio, conf):
         print(f'(*) Remediation goal has been created: {g.get("name")} ({g.get("goaluuid")})')  # noqa
@@ -17,31 +17,26 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-import json
-import os
+import re
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import click
-from tenable.io import TenableIO
 
-from tenable_helpers import commons
-
-try:
-    from keys import ACCESS_KEY, SECRET_KEY
-except Exception as e:  # noqa
-    ACCESS_KEY = os.getenv('ACCESS_KEY')
-    SECRET_KEY = os.getenv('SECRET_KEY')
+from tenable_helpers import cli, commons, pagination, stats, throttle
+from tenable_helpers.cache import Cache
+from tenable_helpers.checkpoint import Checkpoint, run_id
 
 
 def _get_agents(tio, g_id, limit, offset):
-    res = tio.agent_groups.details(g_id, limit=limit, offset=offset)
+    with stats.phase('agents'):
+        res = tio.agent_groups.details(g_id, limit=limit, offset=offset)
     tot = res.get('pagination').get('total')
     agents = [a for a in res.get('agents')]
     return agents, tot
 
 
-def _get_assets(tio, agents):
-    limit = 100
+def _get_assets(tio, agents, page_size=100, prefetch=0):
     assets = []
     f = {
         'and': [
@@ -58,89 +53,234 @@ def _get_assets(tio, agents):
         ]
     }
 
-    # first page
-    res = tio.v3.explore.assets.search_all(filter=f,
-                                           limit=limit,
-                                           return_resp=True)
-    data = json.loads(res.text)
-
-    _assets = [a for a in data.get('assets')]
-    if len(_assets) > 0:
+    paginator = pagination.assets(tio, f, limit=page_size, prefetch=prefetch)
+    for _assets in paginator.pages():
         assets += _assets
         print(f'(*) Got {len(assets)} assets')
-    token = data.get('pagination').get('next')
-
-    # other pages
-    while token:
-        res = tio.v3.explore.assets.search_all(filter=f, limit=limit, next=token, return_resp=True)  # noqa
-        data = json.loads(res.text)
-
-        _assets = [a for a in data.get('assets')]
-        if len(_assets) > 0:
-            assets += _assets
-            print(f'Got {len(assets)} assets')
-        token = data.get('pagination').get('next')
 
     # return assets
     return assets
 
 
 def _assign_tag(tio, tag_id, tag_name, assets):
-    tio.tags.assign([a.get('id') for a in assets], [tag_id])
+    with stats.phase('tag writes'):
+        tio.tags.assign([a.get('id') for a in assets], [tag_id])
     print(f'(*) Tag "{tag_name}" has been assigned to {"|".join([a.get("name") for a in assets])}')  # noqa
 
 
+def _resolve_assets(index, agents):
+    assets = []
+    seen = set()
+    for agent in agents:
+        for a in index.resolve(agent):
+            if a.get('id') not in seen:
+                seen.add(a.get('id'))
+                assets.append(a)
+    print(f'(*) Got {len(assets)} assets')
+    return assets
+
+
+def get_group_assets(tio, g_id, page_size=100, prefetch=0, index=None,
+                     offset=0, limit=100):
+    got = offset
+    tot = offset + 1
+
+    # iterate over agents in agent group
+    while got < tot:
+        agents, tot = _get_agents(tio, g_id, limit, offset)
+        if len(agents) == 0:
+            break
+        got += len(agents)
+        offset += limit
+        print(f'(*) Got {got} over {tot} agents')
+        with stats.phase('resolve agents'):
+            if index is not None:
+                assets = _resolve_assets(index, agents)
+            else:
+                assets = _get_assets(tio, agents, page_size, prefetch)
+        yield assets
+
+
+def group2tag(tio, g_name, g_id, page_size=100, prefetch=0, sync=False,
+              batch_size=1000, index=None, registry=None, checkpoint=None):
+    # progress of the group in a resumed run
+    key = f'group:{g_id}'
+    state = None
+    if checkpoint is not None:
+        state = checkpoint.get(key)
+    if state and state.get('done'):
+        print(f'(*) Agent group "{g_name}" has already been processed')
+        return state.get('tagged')
+
+    # create tag (existing assignments are kept when syncing or resuming)
+    tag = commons.create_tag(tio, 'AgentGroup', g_name,
+                             not (sync or state),
+                             prefetch=prefetch, registry=registry)
+    tag_name = f'{tag.get("category_name")}:{tag.get("value")}'
+    tag_id = tag.get('uuid')
+    print(f'(*) Tag "{tag_name}" with ID "{tag_id}" has been created')
+
+    state = state or {'offset': 0, 'tagged': 0, 'desired': {}}
+    offset = state.get('offset')
+    tagged = state.get('tagged')
+    desired = state.get('desired')
+    limit = 100
+
+    def _save(force=False, **kwargs):
+        if checkpoint is not None:
+            # the desired assets are copied: the checkpoint may be saved by
+            # the thread of another group
+            checkpoint.set(key, {'offset': offset, 'tagged': tagged,
+                                 'desired': dict(desired), **kwargs},
+                           force=force)
+
+    try:
+        for assets in get_group_assets(tio, g_id, page_size, prefetch,
+                                       index, offset, limit):
+            if sync:
+                for a in assets:
+                    desired[a.get('id')] = a.get('name')
+            elif len(assets) > 0:
+                _assign_tag(tio, tag_id, tag_name, assets)
+                tagged += len(assets)
+            offset += limit
+            _save()
+    except BaseException:
+        # the offset of the last page fully handled
+        _save(force=True)
+        raise
+
+    if sync:
+        commons.sync_tag(tio, tag_id, tag_name, desired, prefetch=prefetch,
+                         batch_size=batch_size)
+        tagged = len(desired)
+    desired = {}
+    _save(force=True, done=True)
+    return tagged
+
+
+def groups2tags(tio, groups, workers=4, **kwargs):
+    results = {}
+    failures = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for g in groups:
+            f = pool.submit(group2tag, tio, g.get('name'), g.get('id'),
+                            **kwargs)
+            futures[f] = g
+        done = 0
+        for f in as_completed(futures):
+            g = futures[f]
+            done += 1
+            try:
+                results[g.get('id')] = f.result()
+                print(f'(*) [{done}/{len(groups)}] Agent group "{g.get("name")}" ({g.get("id")}): {results[g.get("id")]} assets tagged')  # noqa
+            except Exception as e:
+                failures[g.get('id')] = e
+                print(f'(!) [{done}/{len(groups)}] Agent group "{g.get("name")}" ({g.get("id")}) failed: {e}')  # noqa
+    return results, failures
+
+
 @click.command()
 @click.option('-n', '--name', 'g_name',
               default=None, help='Name of the agent group')
 @click.option('-i', '--id', 'g_id',
               default=None, help='ID of the agent group')
-def tio_group2tag(g_name, g_id):
+@click.option('--all-groups', 'all_groups', is_flag=True,
+              help='Process all the agent groups')
+@click.option('--match', 'g_match', default=None,
+              help='Process the agent groups whose name matches the regex')
+@click.option('--workers', 'workers', default=4, type=int,
+              help='Number of agent groups processed concurrently')
+@click.option('--prefetch', 'prefetch', default=0, type=int,
+              help='Number of asset pages to prefetch (0 to disable)')
+@click.option('--page-size', 'page_size', default=100, type=int,
+              help='Number of assets requested per page')
+@click.option('--sync', 'sync', is_flag=True,
+              help='Only add and remove the assignments that changed')
+@click.option('--batch-size', 'batch_size', default=1000,
+              type=click.IntRange(min=1),
+              help='Number of assets per tag assign/unassign request')
+@click.option('--index', 'use_index', is_flag=True,
+              help='Resolve agents against a local index of agent assets '
+                   '(always used with --all-groups/--match)')
+@click.option('--cache', 'use_cache', is_flag=True,
+              help='Read agent groups and agent assets through the local '
+                   'cache')
+@click.option('--checkpoint', 'checkpoint_file', default=None,
+              help='Save the progress to this file and resume from it')
+@throttle.options
+@stats.options
+def tio_group2tag(g_name, g_id, all_groups, g_match, workers, prefetch,
+                  page_size, sync, batch_size, use_index, use_cache,
+                  checkpoint_file, read_rate, write_rate):
     # check credentials
-    if not ACCESS_KEY:
+    access_key, secret_key = cli.get_keys()
+    if not access_key:
         print('(!) ACCESS_KEY must be defined')
         sys.exit(1)
 
-    if not SECRET_KEY:
+    if not secret_key:
         print('(!) SECRET_KEY must be defined')
         sys.exit(1)
 
     # init the API
-    tio = TenableIO(ACCESS_KEY, SECRET_KEY)
+    from tenable.io import TenableIO
+    tio = TenableIO(access_key, secret_key)
+    throttle.install(tio, read_rate=read_rate, write_rate=write_rate)
+    stats.install(tio)
+    cache = Cache() if use_cache else None
 
-    # select the group
-    if (not g_name) or (not g_id):
-        groups = commons.get_agent_groups(tio)
-        g = commons.select_agent_group(groups)
-        g_name = g.get('name')
-        g_id = g.get('id')
+    # select the groups
+    groups = []
+    if all_groups or g_match:
+        groups = commons.get_agent_groups(tio, cache)
+        if g_match:
+            p = re.compile(g_match, re.IGNORECASE)
+            groups = [g for g in groups if p.search(g.get('name', ''))]
+        if not groups:
+            print('(!) No agent group has been selected')
+            sys.exit(1)
+        print(f'(*) Selected {len(groups)} agent groups')
+        use_index = True
+    elif (not g_name) or (not g_id):
+        groups = commons.get_agent_groups(tio, cache)
+        groups = [commons.select_agent_group(groups)]
+    else:
+        groups = [{'name': g_name, 'id': g_id}]
 
-    # create tag
-    tag = commons.create_tag(tio, 'AgentGroup', g_name, True)
-    tag_name = f'{tag.get("category_name")}:{tag.get("value")}'
-    tag_id = tag.get('uuid')
-    print(f'(*) Tag "{tag_name}" with ID "{tag_id}" has been created')
+    # index of the agent assets (one bulk fetch instead of a filtered
+    # search for each page of agents), shared by all the groups
+    index = None
+    if use_index:
+        index = commons.AssetIndex.from_agents_assets(tio, prefetch=prefetch,
+                                                      cache=cache)
 
-    #
-    # iterate over agents in agent group
-    #
-    agents = []
-    offset = 0
-    limit = 100
-    got = 0
+    # a checkpoint is resumed only by a run over the same groups
+    checkpoint = None
+    if checkpoint_file:
+        run = run_id(sorted(g.get('id') for g in groups), sync, use_index)
+        checkpoint = Checkpoint(checkpoint_file, run)
 
-    # first page
-    agents, tot = _get_agents(tio, g_id, limit, offset)
-    got += len(agents)
-    print(f'(*) Got {got} over {tot} agents')
-    assets = _get_assets(tio, agents)
-    _assign_tag(tio, tag_id, tag_name, assets)
-
-    # other pages
-    while got < tot:
-        offset += limit
-        agents, tot = _get_agents(tio, g_id, limit, offset)
-        got += len(agents)
-        print(f'(*) Got {got} over {tot} agents')
-        assets = _get_assets(tio, agents)
-        _assign_tag(tio, tag_id, tag_name, assets)
+    kwargs = {
+        'page_size': page_size,
+        'prefetch': prefetch,
+        'sync': sync,
+        'batch_size': batch_size,
+        'index': index,
+        'checkpoint': checkpoint
+    }
+    if len(groups) == 1:
+        g = groups[0]
+        group2tag(tio, g.get('name'), g.get('id'), **kwargs)
+    else:
+        # resolve (and create) all the tags at once
+        registry = commons.TagRegistry(tio, cache=cache)
+        registry.create_many([('AgentGroup', g.get('name')) for g in groups])
+        kwargs['registry'] = registry
+        results, failures = groups2tags(tio, groups, workers, **kwargs)
+        print(f'(*) {len(results)} agent groups processed, {len(failures)} failed')  # noqa
+        if failures:
+            sys.exit(1)
+    if checkpoint is not None:
+        checkpoint.remove()
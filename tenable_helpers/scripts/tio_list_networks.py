@@ -17,86 +17,233 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import asyncio
 import csv
 import json
+import logging
 import os
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import click
-from tenable.io import TenableIO
-
-try:
-    from keys import ACCESS_KEY, SECRET_KEY
-except Exception as e:  # noqa
-    ACCESS_KEY = os.getenv('ACCESS_KEY')
-    SECRET_KEY = os.getenv('SECRET_KEY')
-
-
-def as_csv(networks):
-    fields = [
-        'name',
-        'uuid',
-        'assets_ttl_days',
-        'created',
-        'created_by',
-        'created_in_seconds',
-        'deleted',
-        'deleted_by',
-        'description',
-        'is_default',
-        'modified',
-        'modified_by',
-        'modified_in_seconds',
-        'owner_uuid',
-        'scanner_count'
-    ]
+
+from tenable_helpers import cli, stats, throttle
+
+LOG = logging.getLogger(__name__)
+
+FIELDS = [
+    'name',
+    'uuid',
+    'assets_ttl_days',
+    'created',
+    'created_by',
+    'created_in_seconds',
+    'deleted',
+    'deleted_by',
+    'description',
+    'is_default',
+    'modified',
+    'modified_by',
+    'modified_in_seconds',
+    'owner_uuid',
+    'scanner_count'
+]
+
+# fields added by the enrichment
+ENRICHED_FIELDS = [
+    'scanners',
+    'assets_total',
+    'assets_not_seen'
+]
+
+
+def _details(scanners, counts):
+    return {
+        'scanners': [s.get('name') for s in scanners],
+        'assets_total': counts.get('numAssetsTotal'),
+        'assets_not_seen': counts.get('numAssetsNotSeen')
+    }
+
+
+def get_details(tio, network, not_seen_days=30):
+    n_uuid = network.get('uuid')
+    details = {}
+    try:
+        with stats.phase('enrich'):
+            scanners = tio.networks.list_scanners(n_uuid)
+            counts = tio.networks.network_asset_count(n_uuid, not_seen_days)
+        details = _details(scanners, counts)
+    except Exception as e:
+        LOG.error(f'Unable to get the details of network {n_uuid}: {e}')
+    return details
+
+
+def enrich(tio, networks, workers=8, not_seen_days=30):
+    # keep up to two networks per worker in flight, in the listing order
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for n in networks:
+            if n.get('deleted'):
+                # nothing to ask about a deleted network
+                pending.append((n, None))
+            else:
+                pending.append((n, pool.submit(get_details, tio, n,
+                                               not_seen_days)))
+            if len(pending) >= workers * 2:
+                n, f = pending.popleft()
+                yield dict(n, **f.result()) if f else n
+        while pending:
+            n, f = pending.popleft()
+            yield dict(n, **f.result()) if f else n
+
+
+#
+# Asyncio
+#
+
+async def get_details_async(api, network, not_seen_days=30):
+    n_uuid = network.get('uuid')
+    details = {}
+    try:
+        scanners, counts = await asyncio.gather(
+            api.networks.list_scanners(n_uuid),
+            api.networks.network_asset_count(n_uuid, not_seen_days))
+        details = _details(scanners, counts)
+    except Exception as e:
+        LOG.error(f'Unable to get the details of network {n_uuid}: {e}')
+    return details
+
+
+async def list_networks_async(api, enrich=False, workers=8,
+                              not_seen_days=30):
+    # all the networks are enriched at once, up to "workers" at a time
+    from tenable_helpers import aio
+    networks = [n async for n in api.networks.list(include_deleted=True)]
+    if enrich:
+        alive = [n for n in networks if not n.get('deleted')]
+        with stats.phase('enrich'):
+            details = await aio.gather_bounded(
+                [get_details_async(api, n, not_seen_days) for n in alive],
+                workers)
+        for n, d in zip(alive, details):
+            n.update(d)
+    return networks
+
+
+async def _run_async(access_key, secret_key, enrich, workers, not_seen_days,
+                     read_rate=None, write_rate=None):
+    from tenable_helpers import aio
+    url = os.getenv('TIO_URL', 'https://cloud.tenable.com')
+    scheduler = throttle.AsyncScheduler(read_rate=read_rate,
+                                        write_rate=write_rate)
+    async with aio.AsyncTenableIO(access_key, secret_key, url=url,
+                                  max_connections=workers,
+                                  scheduler=scheduler) as api:
+        return await list_networks_async(api, enrich, workers,
+                                         not_seen_days)
+
+
+def as_csv(networks, fields=FIELDS):
     w = csv.DictWriter(
         sys.stdout,
         fieldnames=fields,
         restval=None,
+        extrasaction='ignore',
         quoting=csv.QUOTE_NONNUMERIC
     )
     w.writeheader()
-    w.writerows(networks)
+    for n in networks:
+        if isinstance(n.get('scanners'), list):
+            n = dict(n, scanners='|'.join(n['scanners']))
+        w.writerow(n)
 
 
 def as_json(networks):
     print(
-        json.dumps(networks, indent=2, sort_keys=True)
+        json.dumps(list(networks), indent=2, sort_keys=True)
     )
 
 
+def as_ndjson(networks):
+    for n in networks:
+        sys.stdout.write(json.dumps(n, sort_keys=True) + '\n')
+
+
 def as_txt(networks):
     for n in networks:
         print(f'Name : {n.get("name")}')
         print(f'ID   : {n.get("uuid")}')
         print(f'URL  : https://cloud.tenable.com/tio/app.html#/settings/sensors/nessus/networks/network-details/{n.get("uuid")}/settings')  # noqa
+        if 'scanners' in n:
+            print(f'Scanners: {", ".join(n.get("scanners"))}')
+            print(f'Assets  : {n.get("assets_total")} ({n.get("assets_not_seen")} not seen recently)')  # noqa
         print('')
 
 
 @click.command()
 @click.option('--as-json', '_as_json', is_flag=True)
+@click.option('--as-ndjson', '_as_ndjson', is_flag=True,
+              help='One JSON document per line, written as they arrive')
 @click.option('--as-csv', '_as_csv', is_flag=True)
-def tio_list_networks(_as_json, _as_csv):
+@click.option('--enrich', '_enrich', is_flag=True,
+              help='Add the assigned scanners and the asset counts')
+@click.option('--not-seen-days', 'not_seen_days', default=30, type=int,
+              help='Days after which an asset is counted as not seen')
+@click.option('--workers', 'workers', default=8, type=int,
+              help='Number of networks enriched concurrently')
+@click.option('--async', 'use_async', is_flag=True,
+              help='Use the asyncio client (requires httpx)')
+@throttle.options
+@stats.options
+def tio_list_networks(_as_json, _as_ndjson, _as_csv, _enrich, not_seen_days,
+                      workers, use_async, read_rate, write_rate):
     # check credentials
-    if not ACCESS_KEY:
+    access_key, secret_key = cli.get_keys()
+    if not access_key:
         print('(!) ACCESS_KEY must be defined')
         sys.exit(1)
 
-    if not SECRET_KEY:
+    if not secret_key:
         print('(!) SECRET_KEY must be defined')
         sys.exit(1)
 
-    # init the API
-    tio = TenableIO(ACCESS_KEY, SECRET_KEY)
+    fields = FIELDS
+    if _enrich:
+        fields = FIELDS + ENRICHED_FIELDS
+
+    if use_async:
+        # one event loop instead of a pool of threads (the output is
+        # written once all the networks have been enriched)
+        from tenable_helpers import aio
+        if aio.httpx is None:
+            print('(!) httpx is not installed (pip install tenable_helpers[async])')  # noqa
+            sys.exit(1)
+        loop = asyncio.new_event_loop()
+        try:
+            networks = loop.run_until_complete(
+                _run_async(access_key, secret_key, _enrich, workers,
+                           not_seen_days, read_rate, write_rate))
+        finally:
+            loop.close()
+    else:
+        # init the API
+        from tenable.io import TenableIO
+        tio = TenableIO(access_key, secret_key)
+        throttle.install(tio, read_rate=read_rate, write_rate=write_rate)
+        stats.install(tio)
 
-    # get the networks
-    networks = [n for n in tio.networks.list(include_deleted=True)]
+        # get the networks (streamed to the output as they arrive)
+        networks = tio.networks.list(include_deleted=True)
+        if _enrich:
+            networks = enrich(tio, networks, workers, not_seen_days)
 
     # print the result
     if _as_json:
         as_json(networks)
+    elif _as_ndjson:
+        as_ndjson(networks)
     elif _as_csv:
-        as_csv(networks)
+        as_csv(networks, fields)
     else:
         as_txt(networks)
@@ -22,101 +22,279 @@ import logging
 import os
 import re
 import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import click
-from tenable.io import TenableIO
 
-from tenable_helpers import commons
+from tenable_helpers import (cli, commons, decoding, exports, pagination,
+                             stats, throttle)
+from tenable_helpers.checkpoint import Checkpoint, run_id
 
 try:
-    from keys import ACCESS_KEY, SECRET_KEY
-except Exception as e:  # noqa
-    ACCESS_KEY = os.getenv('ACCESS_KEY')
-    SECRET_KEY = os.getenv('SECRET_KEY')
+    from re import _parser as sre_parse
+except ImportError:  # python < 3.11
+    import sre_parse
 
 # setup logging
 LOG = logging.getLogger(__name__)
 
 
-def assign_tag(tio, tag_id, tag_name, assets):
-    tio.tags.assign([a.get('id') for a in assets], [tag_id])
-    print(f'(*) Tag "{tag_name}" has been assigned to {"|".join([a.get("name") for a in assets])}')  # noqa
+def compile_regex(regex):
+    return re.compile(regex, re.MULTILINE | re.IGNORECASE)
 
 
 def parse_output(output, regex):
     result = False
-    p = re.compile(regex, re.MULTILINE | re.IGNORECASE)
-    m = p.search(output)
+    if isinstance(regex, str):
+        regex = compile_regex(regex)
+    m = regex.search(output)
     if m:
         result = True
     return result
 
 
-def get_assets_from_findings(findings, regex, regex_negative):
-    assets = []
-    for f in findings:
-        output = f.get('output', '')
-        do_append = parse_output(output, regex)
-        if regex_negative:
-            do_append = not do_append
-        if do_append:
-            assets.append(f.get('asset'))
-    return assets
+#
+# Rules
+#
 
+class Rule:
+    def __init__(self, category, name, regex, negative=False):
+        self.category = category
+        self.name = name
+        self.regex = regex
+        self.negative = negative
+        self.pattern = compile_regex(regex)
+        self.literal = required_literal(regex)
 
-def find_assets_and_assign_tag(tio, tag_name, tag_id, filters, regex,
-                               regex_negative, *args, **kwargs):
-    assets = []
-    all_assets = []
+        # set once the tag has been created
+        self.tag_id = None
+        self.tag_name = f'{category}:{name}'
+
+    def match(self, output, lowered=None):
+        # cheap prefilter: the regex can't match an output that does not
+        # contain its longest mandatory literal
+        if self.literal is not None:
+            if lowered is None:
+                lowered = output.lower()
+            if self.literal not in lowered:
+                return self.negative
+        return parse_output(output, self.pattern) != self.negative
+
+
+def required_literal(regex, min_length=3):
+    try:
+        parsed = sre_parse.parse(regex, re.MULTILINE | re.IGNORECASE)
+    except Exception as e:
+        LOG.debug(f'Unable to parse regex {regex}: {e}')
+        return None
+
+    # longest run of literals at the top level of the pattern
+    best = ''
+    run = ''
+    for op, av in parsed:
+        if op == sre_parse.LITERAL:
+            run += chr(av)
+        else:
+            best = max(best, run, key=len)
+            run = ''
+    best = max(best, run, key=len)
+
+    if len(best) < min_length:
+        return None
+    return best.lower()
+
+
+def load_rules(rules_str):
+    data = commons.str_to_json(rules_str)
+    if isinstance(data, list):
+        data = {'rules': data}
+    if not isinstance(data, dict):
+        raise ValueError('Unable to load rules: not a list or an object')
+
+    rules = []
+    try:
+        for r in data.get('rules', []):
+            rules.append(Rule(r['category'], r['name'], r['regex'],
+                              r.get('negative', False)))
+    except KeyError as e:
+        raise ValueError(f'Unable to load rules: {e} is not defined')
+    except Exception as e:
+        raise ValueError(f'Unable to load rules: {e}')
+
+    return data.get('filters'), rules
+
+
+def get_assets_from_findings_rules(findings, rules):
+    matches = [[] for r in rules]
+    with stats.phase('match'):
+        for f in findings:
+            output = f.get('output', '')
+            lowered = output.lower()
+            for i, r in enumerate(rules):
+                if r.match(output, lowered):
+                    matches[i].append(f.get('asset'))
+    return matches
+
+
+#
+# Process pool matching
+#
+
+_worker_rules = None
+
+
+def _init_worker(rules):
+    global _worker_rules
+    _worker_rules = rules
 
-    limit = 100
-    sort = [('severity', 'desc')]
-    fields = ['asset.name', 'asset.id', 'output', 'severity']
 
-    pagination = None
+def _match_findings(findings):
+    return get_assets_from_findings_rules(findings, _worker_rules)
+
+
+def match_pages(pages, rules, workers=1, mp_context=None):
+    # single process: match each page on the main thread
+    if workers < 2:
+        for findings in pages:
+            yield get_assets_from_findings_rules(findings, rules)
+        return
+
+    # process pool: keep up to two pages per worker in flight, so that the
+    # next pages are fetched while the current ones are being matched
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=mp_context,
+                             initializer=_init_worker,
+                             initargs=(rules,)) as pool:
+        pending = deque()
+        for findings in pages:
+            # only ship what the workers need
+            _findings = [{'asset': f.get('asset'),
+                          'output': f.get('output', '')} for f in findings]
+            pending.append(pool.submit(_match_findings, _findings))
+            if len(pending) >= workers * 2:
+                with stats.phase('match (wait for workers)'):
+                    result = pending.popleft().result()
+                yield result
+        while pending:
+            with stats.phase('match (wait for workers)'):
+                result = pending.popleft().result()
+            yield result
+
+
+def create_tags(tio, rules, prefetch=0, registry=None,
+                delete_assignments=True):
+    # with many rules, all the missing tags are created at once
+    if registry is None and len(rules) > 1:
+        registry = commons.TagRegistry(tio)
+    if registry is not None:
+        registry.create_many([(r.category, r.name) for r in rules])
+    for r in rules:
+        tag = commons.create_tag(tio, r.category, r.name, delete_assignments,
+                                 prefetch=prefetch, registry=registry)
+        r.tag_name = f'{tag.get("category_name")}:{tag.get("value")}'
+        r.tag_id = tag.get('uuid')
+        print(f'(*) Tag "{r.tag_name}" with ID "{r.tag_id}" has been created')  # noqa
+
+
+def find_assets_and_assign_tags(tio, filters, rules, page_size=100,
+                                prefetch=0, batch_size=1000,
+                                flush_interval=None, workers=1,
+                                backend='search', export_filters=None,
+                                chunk_workers=4, stream=False,
+                                checkpoint=None, mp_context=None):
+    seen = [set() for r in rules]
+    pending = [[] for r in rules]
     token = None
+    done = False
+    if checkpoint is not None and checkpoint.resumed:
+        for i, asset_id in checkpoint.journal('seen'):
+            seen[i].add(asset_id)
+        pending = checkpoint.get('pending', pending)
+        token = checkpoint.get('token')
+        done = checkpoint.get('done', False)
+        print(f'(*) Resuming from {checkpoint.path}: {sum(len(s) for s in seen)} assets already matched')  # noqa
 
-    # get first page of results
-    res = tio.v3.explore.findings.search_host(filter=filters,
-                                              sort=sort,
-                                              fields=fields,
-                                              limit=limit,
-                                              return_resp=True)
-    data = json.loads(res.text)
-    findings = data.get('findings', [])
-    assets = get_assets_from_findings(findings, regex, regex_negative)
-    if len(assets) > 0:
-        _assets = [a for a in assets if a.get('id') not in all_assets]
-        if len(_assets) > 0:
-            assign_tag(tio, tag_id, tag_name, _assets)
-            all_assets += [a.get('id') for a in _assets]
-    pagination = data.get('pagination')
-    if pagination:
-        token = pagination.get('next')
+    if done:
+        # all the pages had been handled, only the writes are left
+        pages = []
+    elif backend == 'export':
+        if export_filters is None:
+            export_filters = exports.vuln_filters(filters)
+        pages = exports.iter_vuln_chunks(tio, export_filters,
+                                         workers=chunk_workers, stream=stream)
     else:
-        token = None
-
-    # get other pages of results (if any)
-    while token:
-        res = tio.v3.explore.findings.search_host(filter=filters,
-                                                  sort=None,
-                                                  fields=fields,
-                                                  limit=limit,
-                                                  return_resp=True,
-                                                  next=token)
-        data = json.loads(res.text)
-        findings = data.get('findings', [])
-        assets = get_assets_from_findings(findings, regex, regex_negative)
-        if len(assets) > 0:
-            _assets = [a for a in assets if a.get('id') not in all_assets]
-            if len(_assets) > 0:
-                assign_tag(tio, tag_id, tag_name, _assets)
-                all_assets += [a.get('id') for a in _assets]
-        pagination = data.get('pagination')
-        if pagination:
-            token = pagination.get('next')
-        else:
-            token = None
+        sort = [('severity', 'desc')]
+        fields = ['asset.name', 'asset.id', 'output', 'severity']
+        paginator = pagination.findings(tio, filters, sort=sort,
+                                        fields=fields, limit=page_size,
+                                        prefetch=prefetch, stream=stream,
+                                        token=token)
+        pages = paginator.pages()
+
+    writers = [commons.TagWriter(tio, r.tag_id, r.tag_name,
+                                 batch_size=batch_size,
+                                 flush_interval=flush_interval)
+               for r in rules]
+    # writes still pending when the checkpoint was saved
+    for i, assets in enumerate(pending):
+        writers[i].add(assets)
+
+    # token of the page following each one handed to the matchers (the
+    # export chunks can't be resumed, only the matched assets are kept)
+    tokens = deque()
+
+    def _pages():
+        for page in pages:
+            tokens.append(paginator.token if backend != 'export' else None)
+            yield page
+
+    try:
+        for matches in match_pages(_pages(), rules, workers, mp_context):
+            for i, assets in enumerate(matches):
+                _assets = []
+                for a in assets:
+                    if a.get('id') not in seen[i]:
+                        seen[i].add(a.get('id'))
+                        _assets.append(a)
+                if len(_assets) > 0:
+                    writers[i].add(_assets)
+                    if checkpoint is not None:
+                        checkpoint.add('seen', [(i, a.get('id'))
+                                                for a in _assets])
+                else:
+                    writers[i].tick()
+            token = tokens.popleft()
+            if checkpoint is not None:
+                checkpoint.update(token=token,
+                                  pending=[w.pending() for w in writers])
+        if checkpoint is not None:
+            checkpoint.update(done=True)
+        for w in writers:
+            w.flush()
+    except BaseException:
+        # the token of the last page fully handled, and everything matched
+        # so far (the assets of the current page are pending)
+        if checkpoint is not None:
+            checkpoint.update(force=True,
+                              pending=[w.pending() for w in writers])
+        raise
+    finally:
+        for w in writers:
+            w.flush()
+
+    return seen
+
+
+def find_assets_and_assign_tag(tio, tag_name, tag_id, filters, regex,
+                               regex_negative, **kwargs):
+    # single rule: the options are the ones of find_assets_and_assign_tags
+    category, _, name = tag_name.partition(':')
+    rule = Rule(category, name, regex, regex_negative)
+    rule.tag_id = tag_id
+    rule.tag_name = tag_name
+    seen = find_assets_and_assign_tags(tio, filters, [rule], **kwargs)
+    return seen[0]
 
 
 def build_filters(filters_str):
@@ -167,38 +345,123 @@ def build_regex(regex_str):
 
 @click.command()
 @click.option('-c', '--tag-category', 't_category', default=None,
-              help='Name of the tag category', required=True)
+              help='Name of the tag category')
 @click.option('-n', '--tag-name', 't_name', default=None,
-              help='Name of the tag', required=True)
+              help='Name of the tag')
 @click.option('-e', '--regex', 'regex_str', default=None,
-              help='Regex to parse the plugin output', required=True)
+              help='Regex to parse the plugin output')
 @click.option('--regex-negative', 'regex_negative', is_flag=True,
               help='Use regex as negative')
+@click.option('-r', '--rules', 'rules_str', default=None,
+              help='Rules (regex and tag pairs) to evaluate in a single scan')
 @click.option('-f', '--filters', 'filters_str', default=None,
-              help='Assets filters', required=True)
-def tio_po2tag(t_category, t_name, regex_str, regex_negative, filters_str):
+              help='Assets filters')
+@click.option('--prefetch', 'prefetch', default=0, type=int,
+              help='Number of pages to prefetch (0 to disable)')
+@click.option('--page-size', 'page_size', default=100, type=int,
+              help='Number of findings requested per page')
+@click.option('--batch-size', 'batch_size', default=1000,
+              type=click.IntRange(min=1),
+              help='Number of assets tagged per assign request')
+@click.option('--flush-interval', 'flush_interval', default=None, type=float,
+              help='Max seconds to hold tag assignments before sending them')
+@click.option('--workers', 'workers', default=1, type=int,
+              help='Number of processes used to match the plugin outputs')
+@click.option('--backend', 'backend', default='search',
+              type=click.Choice(['search', 'export']),
+              help='Read the findings via search pages or via bulk export')
+@click.option('--export-filters', 'export_filters_str', default=None,
+              help='Vulnerability export filters (default: derived from -f)')
+@click.option('--chunk-workers', 'chunk_workers', default=4, type=int,
+              help='Number of export chunks downloaded concurrently')
+@click.option('--stream', 'stream', is_flag=True,
+              help='Decode the findings one at a time (requires ijson)')
+@click.option('--checkpoint', 'checkpoint_file', default=None,
+              help='Save the progress to this file and resume from it')
+@throttle.options
+@stats.options
+def tio_po2tag(t_category, t_name, regex_str, regex_negative, rules_str,
+               filters_str, prefetch, page_size, batch_size, flush_interval,
+               workers, backend, export_filters_str, chunk_workers, stream,
+               checkpoint_file, read_rate, write_rate):
     # check credentials
-    if not ACCESS_KEY:
+    access_key, secret_key = cli.get_keys()
+    if not access_key:
         print('(!) ACCESS_KEY must be defined')
         sys.exit(1)
 
-    if not SECRET_KEY:
+    if not secret_key:
         print('(!) SECRET_KEY must be defined')
         sys.exit(1)
 
-    # build filters and regex
-    filters = build_filters(filters_str)
-    regex = build_regex(regex_str)
+    # build filters and rules
+    filters = None
+    if rules_str:
+        try:
+            filters, rules = load_rules(rules_str)
+        except ValueError as e:
+            print(f'(!) {e}')
+            sys.exit(1)
+        if not rules:
+            print('(!) No rules have been defined')
+            sys.exit(1)
+    else:
+        if not (t_category and t_name and regex_str):
+            print('(!) --tag-category, --tag-name and --regex must be defined (or use --rules)')  # noqa
+            sys.exit(1)
+        regex = build_regex(regex_str)
+        rules = [Rule(t_category, t_name, regex, regex_negative)]
+
+    if filters_str:
+        filters = build_filters(filters_str)
+    export_filters = None
+    if export_filters_str:
+        try:
+            export_filters = commons.str_to_json(export_filters_str)
+        except ValueError as e:
+            print(f'(!) {e}')
+            sys.exit(1)
+    if not filters and export_filters is None:
+        print('(!) --filters must be defined')
+        sys.exit(1)
+    if backend == 'export' and export_filters is None:
+        try:
+            export_filters = exports.vuln_filters(filters)
+        except ValueError as e:
+            print(f'(!) {e}')
+            sys.exit(1)
+        print(f'(*) Export filters: {json.dumps(export_filters)}')
+
+    if stream and not decoding.can_stream():
+        print('(!) ijson is not installed, the findings will be decoded page by page')  # noqa
+        stream = False
 
     # init the API
-    tio = TenableIO(ACCESS_KEY, SECRET_KEY)
+    from tenable.io import TenableIO
+    tio = TenableIO(access_key, secret_key)
+    throttle.install(tio, read_rate=read_rate, write_rate=write_rate)
+    stats.install(tio)
+
+    # a checkpoint is resumed only by a run with the same inputs
+    checkpoint = None
+    if checkpoint_file:
+        run = run_id(filters, export_filters, backend, page_size,
+                     [(r.category, r.name, r.regex, r.negative)
+                      for r in rules])
+        checkpoint = Checkpoint(checkpoint_file, run)
 
-    # create tag
-    tag = commons.create_tag(tio, t_category, t_name, True)
-    tag_name = f'{tag.get("category_name")}:{tag.get("value")}'
-    tag_id = tag.get('uuid')
-    print(f'(*) Tag "{tag_name}" with ID "{tag_id}" has been created')
+    # create tags (a resumed run keeps the assignments done so far)
+    resumed = checkpoint is not None and checkpoint.resumed
+    create_tags(tio, rules, prefetch=prefetch,
+                delete_assignments=not resumed)
 
-    # find assets and assign tag
-    find_assets_and_assign_tag(tio, tag_name, tag_id, filters, regex,
-                               regex_negative)
+    # find assets and assign tags
+    find_assets_and_assign_tags(tio, filters, rules, page_size=page_size,
+                                prefetch=prefetch, batch_size=batch_size,
+                                flush_interval=flush_interval,
+                                workers=workers, backend=backend,
+                                export_filters=export_filters,
+                                chunk_workers=chunk_workers, stream=stream,
+                                checkpoint=checkpoint)
+    if checkpoint is not None:
+        checkpoint.remove()
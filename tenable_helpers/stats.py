@@ -0,0 +1,196 @@
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import cProfile
+import functools
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import click
+
+# latency histogram buckets (seconds)
+BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf')]
+
+_ID = re.compile(r'/([0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?'
+                 r'[0-9a-f]{12}|[0-9a-f]{32}|\d+)(?=/|$)', re.IGNORECASE)
+
+# statistics of the current run (None when disabled)
+_active = None
+
+
+def endpoint(method, url):
+    path = _ID.sub('/{id}', urlparse(url).path)
+    return f'{method.upper()} {path}'
+
+
+class Stats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases = {}
+        self.counters = {}
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                p = self.phases.setdefault(name, [0, 0.0])
+                p[0] += 1
+                p[1] += elapsed
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def request(self, method, url, status, elapsed, size):
+        key = endpoint(method, url)
+        with self._lock:
+            e = self.endpoints.get(key)
+            if e is None:
+                e = {'count': 0, 'errors': 0, 'bytes': 0, 'time': 0.0,
+                     'max': 0.0, 'histogram': [0] * len(BUCKETS)}
+                self.endpoints[key] = e
+            e['count'] += 1
+            e['errors'] += 1 if status >= 400 else 0
+            e['bytes'] += size
+            e['time'] += elapsed
+            e['max'] = max(e['max'], elapsed)
+            for i, b in enumerate(BUCKETS):
+                if elapsed <= b:
+                    e['histogram'][i] += 1
+                    break
+
+    def _on_response(self, response, *args, **kwargs):
+        self.request(response.request.method, response.request.url,
+                     response.status_code,
+                     response.elapsed.total_seconds(),
+                     len(response.content or b''))
+
+    def install(self, tio):
+        tio._session.hooks['response'].append(self._on_response)
+        return self
+
+    def print_summary(self):
+        elapsed = time.monotonic() - self.started
+        print(f'(*) Run time: {elapsed:.2f}s')
+
+        if self.phases:
+            print('(*) Phases')
+            print(f'    {"phase":<24} {"calls":>8} {"total(s)":>10}')
+            for name, (calls, total) in sorted(self.phases.items()):
+                print(f'    {name:<24} {calls:>8} {total:>10.2f}')
+
+        if self.counters:
+            print('(*) Counters')
+            for name, value in sorted(self.counters.items()):
+                print(f'    {name:<24} {value:>8}')
+
+        if self.endpoints:
+            hist = ' '.join(f'{"<=" + str(b) if b != float("inf") else ">10":>7}'  # noqa
+                            for b in BUCKETS)
+            print('(*) Requests (latency histogram in seconds)')
+            print(f'    {"endpoint":<56} {"count":>7} {"errors":>6} {"MB":>8} {"avg(s)":>7} {"max(s)":>7} {hist}')  # noqa
+            for key, e in sorted(self.endpoints.items()):
+                avg = e['time'] / e['count']
+                mb = e['bytes'] / 1024 / 1024
+                hist = ' '.join(f'{h:>7}' for h in e['histogram'])
+                print(f'    {key:<56} {e["count"]:>7} {e["errors"]:>6} {mb:>8.2f} {avg:>7.3f} {e["max"]:>7.3f} {hist}')  # noqa
+
+
+#
+# Module level helpers (no-op when the statistics are disabled)
+#
+
+def enable():
+    global _active
+    _active = Stats()
+    return _active
+
+
+def disable():
+    global _active
+    _active = None
+
+
+def active():
+    return _active
+
+
+def install(tio):
+    if _active is not None:
+        _active.install(tio)
+    return tio
+
+
+@contextmanager
+def phase(name):
+    if _active is None:
+        yield
+    else:
+        with _active.phase(name):
+            yield
+
+
+def count(name, n=1):
+    if _active is not None:
+        _active.count(name, n)
+
+
+def start(profile_file=None):
+    enable()
+    profiler = None
+    if profile_file:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+
+def finish(profiler=None, profile_file=None, show_stats=True):
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(profile_file)
+        print(f'(*) Profile saved: {profile_file}')
+    if show_stats and _active is not None:
+        _active.print_summary()
+    disable()
+
+
+def options(f):
+    @click.option('--stats', 'show_stats', is_flag=True,
+                  help='Print API and per-phase statistics at the end')
+    @click.option('--profile', 'profile_file', default=None,
+                  help='Save cProfile data to the file')
+    @functools.wraps(f)
+    def wrapper(*args, show_stats=False, profile_file=None, **kwargs):
+        if not (show_stats or profile_file):
+            return f(*args, **kwargs)
+        profiler = start(profile_file)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            finish(profiler, profile_file, show_stats)
+    return wrapper
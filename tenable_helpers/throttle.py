@@ -0,0 +1,287 @@
+"""
+Copyright 2022 Paolo Smiraglia <paolo.smiraglia@gmail.com>
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+import logging
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+import click
+
+LOG = logging.getLogger(__name__)
+
+# default requests per second
+READ_RATE = 20
+WRITE_RATE = 5
+
+
+def retry_after(response, default=1.0):
+    value = None
+    if response is not None:
+        value = response.headers.get('retry-after')
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+# POST requests that do not change anything: searches, and the bulk exports
+# (e.g. "vulns/export", "assets/v2/export", "api/v3/findings/.../search")
+READ_ONLY_POST = re.compile(r'(^|/)(search|export)$')
+
+
+def is_read(method, path):
+    path = urlparse(path).path.rstrip('/')
+    return (method.upper() in ('GET', 'HEAD') or
+            READ_ONLY_POST.search(path) is not None)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1, rate))
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        # 0 when a token has been taken, otherwise the seconds to wait
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._last
+            self._tokens = min(self.burst,
+                               self._tokens + elapsed * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class Budget:
+    def __init__(self, name, rate, burst=None, concurrency=8,
+                 min_concurrency=1):
+        self.name = name
+        # no rate (0): only the concurrency is limited
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_concurrency = concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(concurrency)
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _admit(self):
+        # called with self._cond held: 0 when the request can start,
+        # otherwise the seconds to wait (None: until a request completes)
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            return pause
+        if self.in_flight >= int(self.limit):
+            return None
+        self.in_flight += 1
+        return 0
+
+    def _notify(self):
+        self._cond.notify_all()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._admit()
+                if wait == 0:
+                    break
+                self._cond.wait(wait)
+        if self.bucket is not None:
+            self.bucket.acquire()
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._notify()
+
+    def success(self):
+        # additive increase: about +1 every "limit" successful requests
+        with self._cond:
+            self.requests += 1
+            if self.limit < self.max_concurrency:
+                self.limit = min(self.max_concurrency,
+                                 self.limit + 1 / self.limit)
+                self._notify()
+
+    def throttle(self, delay):
+        # multiplicative decrease, and nobody starts a new request until
+        # the server says we can
+        with self._cond:
+            self.requests += 1
+            self.throttled += 1
+            self.limit = max(self.min_concurrency, self.limit / 2)
+            self._paused_until = max(self._paused_until,
+                                     time.monotonic() + delay)
+            LOG.info(f'Throttled on {self.name} requests, concurrency limit is now {int(self.limit)}, pausing for {delay:.1f}s')  # noqa
+            self._notify()
+
+
+class AsyncBudget(Budget):
+    # the same budget for the coroutines of an event loop: acquire() is a
+    # coroutine, woken up when a request completes or the limit changes
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wake = None
+
+    def _notify(self):
+        super()._notify()
+        if self._wake is not None:
+            self._wake.set()
+
+    async def acquire(self):
+        # created here, so that it belongs to the running loop
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        while True:
+            with self._cond:
+                wait = self._admit()
+                if wait == 0:
+                    break
+                self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        if self.bucket is not None:
+            await self.bucket.acquire_async()
+
+
+class Scheduler:
+    budget_class = Budget
+
+    def __init__(self, read_rate=None, write_rate=None, read_concurrency=16,
+                 write_concurrency=4, max_retries=5):
+        # requests per second: None for the default rate, 0 for no limit
+        if read_rate is None:
+            read_rate = READ_RATE
+        if write_rate is None:
+            write_rate = WRITE_RATE
+        self.read = self.budget_class('read', read_rate,
+                                      concurrency=read_concurrency)
+        self.write = self.budget_class('write', write_rate,
+                                       concurrency=write_concurrency)
+        self.max_retries = max_retries
+
+    def budget(self, method, path):
+        return self.read if is_read(method, path) else self.write
+
+    def call(self, budget, fn, *args, **kwargs):
+        retries = 0
+        while True:
+            budget.acquire()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                response = getattr(e, 'response', None)
+                status = getattr(response, 'status_code', None)
+                if status != 429 or retries >= self.max_retries:
+                    raise
+                retries += 1
+                # the budget has already been throttled by the hook
+            finally:
+                budget.release()
+
+    def _on_response(self, response, *args, **kwargs):
+        budget = self.budget(response.request.method, response.request.url)
+        if response.status_code == 429:
+            budget.throttle(retry_after(response))
+        else:
+            budget.success()
+
+    def install(self, tio):
+        # every request of the session goes through the scheduler, and every
+        # response (also the ones pyTenable retries on its own) is fed back
+        # to it
+        _req = tio._req
+
+        def _scheduled_req(method, path, **kwargs):
+            return self.call(self.budget(method, path), _req, method, path,
+                             **kwargs)
+
+        tio._req = _scheduled_req
+        tio._session.hooks['response'].append(self._on_response)
+        return self
+
+    def summary(self):
+        return {b.name: {'requests': b.requests,
+                         'throttled': b.throttled,
+                         'concurrency': int(b.limit)}
+                for b in (self.read, self.write)}
+
+
+class AsyncScheduler(Scheduler):
+    budget_class = AsyncBudget
+
+    async def call(self, budget, fn, *args, **kwargs):
+        # fn is a coroutine returning the response: the 429s feed the
+        # budget and are retried once its pause is over
+        retries = 0
+        while True:
+            await budget.acquire()
+            try:
+                res = await fn(*args, **kwargs)
+            finally:
+                budget.release()
+            if res.status_code != 429:
+                budget.success()
+                return res
+            budget.throttle(retry_after(res))
+            if retries >= self.max_retries:
+                return res
+            retries += 1
+
+
+def install(tio, **kwargs):
+    return Scheduler(**kwargs).install(tio)
+
+
+def options(f):
+    # the rates of the scheduler, passed to the command as read_rate and
+    # write_rate (None: the default rate)
+    f = click.option('--write-rate', 'write_rate', default=None,
+                     type=click.FloatRange(min=0),
+                     help=f'Max write requests per second (default: {WRITE_RATE}, 0: no limit)')(f)  # noqa
+    f = click.option('--read-rate', 'read_rate', default=None,
+                     type=click.FloatRange(min=0),
+                     help=f'Max read requests per second (default: {READ_RATE}, 0: no limit)')(f)  # noqa
+    return f
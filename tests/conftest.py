@@ -0,0 +1,95 @@
+import json
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.content = json.dumps(body).encode()
+        self.status_code = 200
+
+
+class FakeSearch:
+    # a paginated search endpoint: the token is the offset of the next page
+    def __init__(self, key, items):
+        self.key = key
+        self.items = items
+        self.calls = 0
+
+    def __call__(self, filter=None, sort=None, fields=None, limit=100,
+                 return_resp=False, next=None):
+        self.calls += 1
+        start = int(next or 0)
+        end = start + limit
+        token = str(end) if end < len(self.items) else None
+        return FakeResponse({self.key: self.items[start:end],
+                             'pagination': {'next': token,
+                                            'total': len(self.items)}})
+
+
+class FakeTags:
+    # the tags of the tenant (a category:value pair can't be created twice)
+    # and their assignments, whose writes fail while "down" is set
+    def __init__(self):
+        self.tags = []
+        self.lookups = 0
+        self.assigned = {}
+        self.down = False
+        self.writes = []
+
+    def list(self, *filters, limit=None):
+        if filters:
+            self.lookups += 1
+        for t in self.tags:
+            if all(t[f] == v for f, _, v in filters):
+                yield t
+
+    def create(self, category, value, **kwargs):
+        if any(t['category_name'] == category and t['value'] == value
+               for t in self.tags):
+            raise ValueError(f'duplicate tag {category}:{value}')
+        tag = {'uuid': str(uuid.uuid4()), 'category_name': category,
+               'value': value}
+        self.tags.append(tag)
+        return tag
+
+    def _write(self, ids, tags, add):
+        if self.down:
+            raise ConnectionError('connection reset by peer')
+        self.writes.append(list(ids))
+        for t in tags:
+            current = self.assigned.setdefault(t, set())
+            if add:
+                current.update(ids)
+            else:
+                current.difference_update(ids)
+
+    def assign(self, ids, tags):
+        self._write(ids, tags, True)
+
+    def unassign(self, ids, tags):
+        self._write(ids, tags, False)
+
+
+class FakeAgentGroups:
+    def __init__(self):
+        # group ID -> agents
+        self.groups = {}
+
+    def details(self, group_id, limit=100, offset=0):
+        agents = self.groups.get(group_id, [])
+        return {'agents': agents[offset:offset + limit],
+                'pagination': {'total': len(agents)}}
+
+
+@pytest.fixture
+def tio():
+    findings = FakeSearch('findings', [])
+    assets = FakeSearch('assets', [])
+    explore = SimpleNamespace(
+        findings=SimpleNamespace(search_host=findings),
+        assets=SimpleNamespace(search_all=assets))
+    return SimpleNamespace(v3=SimpleNamespace(explore=explore),
+                           tags=FakeTags(), agent_groups=FakeAgentGroups())
@@ -0,0 +1,139 @@
+import json
+
+import pytest
+
+from tenable_helpers.checkpoint import Checkpoint, run_id
+from tenable_helpers.commons import AssetIndex
+from tenable_helpers.scripts.tio_group2tag import group2tag
+from tenable_helpers.scripts.tio_po2tag import (Rule,
+                                                find_assets_and_assign_tags)
+
+TAG_ID = '00000000-0000-0000-0000-000000000001'
+
+
+def fake_findings(n, output='match'):
+    return [{'asset': {'id': f'a{i}', 'name': f'host-{i}'}, 'output': output}
+            for i in range(n)]
+
+
+def _rule():
+    rule = Rule('Test', 'Match', '^match$')
+    rule.tag_id = TAG_ID
+    return rule
+
+
+def _po2tag(tio, checkpoint, **kwargs):
+    kwargs.setdefault('page_size', 2)
+    kwargs.setdefault('batch_size', 4)
+    return find_assets_and_assign_tags(tio, {}, [_rule()],
+                                       checkpoint=checkpoint, **kwargs)
+
+
+def test_resume_after_failed_write(tio, tmp_path):
+    tio.v3.explore.findings.search_host.items = fake_findings(10)
+    path = str(tmp_path / 'po2tag.checkpoint')
+    run = run_id('po2tag', TAG_ID)
+
+    # the first batch (a0-a3) can't be written
+    tio.tags.down = True
+    with pytest.raises(ConnectionError):
+        _po2tag(tio, Checkpoint(path, run))
+    assert tio.tags.assigned == {}
+
+    tio.tags.down = False
+    checkpoint = Checkpoint(path, run)
+    assert checkpoint.resumed
+    _po2tag(tio, checkpoint)
+    assert tio.tags.assigned[TAG_ID] == {f'a{i}' for i in range(10)}
+
+
+def test_resume_skips_the_written_pages(tio, tmp_path):
+    search = tio.v3.explore.findings.search_host
+    search.items = fake_findings(10)
+    path = str(tmp_path / 'po2tag.checkpoint')
+    run = run_id('po2tag', TAG_ID)
+
+    # the third batch (a8-a9, flushed at the end) can't be written
+    requests = []
+
+    def _assign(ids, tags):
+        requests.append(ids)
+        if len(requests) > 2:
+            raise ConnectionError('connection reset by peer')
+        tio.tags.assigned.setdefault(tags[0], set()).update(ids)
+
+    tio.tags.assign = _assign
+    with pytest.raises(ConnectionError):
+        _po2tag(tio, Checkpoint(path, run, interval=0))
+    assert tio.tags.assigned[TAG_ID] == {f'a{i}' for i in range(8)}
+
+    del tio.tags.assign
+    search.calls = 0
+    checkpoint = Checkpoint(path, run, interval=0)
+    seen = _po2tag(tio, checkpoint)
+    assert seen[0] == {f'a{i}' for i in range(10)}
+    assert tio.tags.writes == [['a8', 'a9']]
+    assert search.calls == 0
+
+
+def test_group2tag_resume(tio, tmp_path):
+    index = AssetIndex()
+    for i in range(250):
+        index.add({'id': f'a{i}', 'name': f'host-{i}', 'agent_uuid': f'u{i}'})
+    tio.agent_groups.groups[1] = [{'uuid': f'u{i}', 'name': f'host-{i}'}
+                                  for i in range(250)]
+    path = str(tmp_path / 'group2tag.checkpoint')
+    run = run_id('group2tag', 1)
+
+    # the second page of agents can't be tagged
+    def _assign(ids, tags):
+        if tio.tags.writes:
+            raise ConnectionError('connection reset by peer')
+        tio.tags.writes.append(ids)
+
+    tio.tags.assign = _assign
+    with pytest.raises(ConnectionError):
+        group2tag(tio, 'g1', 1, index=index, checkpoint=Checkpoint(path, run))
+
+    del tio.tags.assign
+    tio.tags.writes = []
+    tagged = group2tag(tio, 'g1', 1, index=index,
+                       checkpoint=Checkpoint(path, run))
+    assert tagged == 250
+    assert tio.tags.writes == [[f'a{i}' for i in range(100, 200)],
+                               [f'a{i}' for i in range(200, 250)]]
+
+
+def test_journal(tmp_path):
+    path = str(tmp_path / 'state')
+    checkpoint = Checkpoint(path, 'run', interval=60)
+    checkpoint.add('seen', [1, 2])
+    checkpoint.set('token', 'x')
+    checkpoint.add('seen', [3])
+    checkpoint.set('token', 'y', force=True)
+
+    # the run died while appending to the journal
+    with open(f'{path}.journal', 'a') as fp:
+        fp.write(json.dumps({'key': 'seen', 'items': [4]})[:10])
+
+    checkpoint = Checkpoint(path, 'run')
+    assert checkpoint.resumed
+    assert checkpoint.get('token') == 'y'
+    assert checkpoint.journal('seen') == [1, 2, 3]
+
+    checkpoint.remove()
+    assert not (tmp_path / 'state').exists()
+    assert not (tmp_path / 'state.journal').exists()
+
+
+def test_another_run_starts_over(tmp_path):
+    path = str(tmp_path / 'state')
+    checkpoint = Checkpoint(path, run_id('a'))
+    checkpoint.add('seen', [1])
+    checkpoint.set('token', 'x', force=True)
+
+    checkpoint = Checkpoint(path, run_id('b'))
+    assert not checkpoint.resumed
+    assert checkpoint.get('token') is None
+    assert checkpoint.journal('seen') == []
+    assert not (tmp_path / 'state.journal').exists()
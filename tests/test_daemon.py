@@ -0,0 +1,67 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from tenable_helpers.daemon import Daemon, make_server
+
+TOKEN = 'secret'
+FILTERS = {'and': [{'property': 'definition.id', 'operator': 'eq',
+                    'value': ['20811']}]}
+RULES = [{'category': 'Chrome', 'name': 'Installed', 'regex': '^chrome'}]
+GOAL = {'name': 'goal', 'description': 'test', 'conditions': FILTERS,
+        'start_date': '2026-01-01', 'due_date': '2026-02-01'}
+
+
+@pytest.fixture
+def server(tio):
+    server = make_server(Daemon(tio), port=0, token=TOKEN)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,),
+                              daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _post(server, kind, job):
+    host, port = server.server_address[:2]
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    conn.request('POST', f'/jobs/{kind}', body=json.dumps(job),
+                 headers={'Content-Type': 'application/json',
+                          'Authorization': f'Bearer {TOKEN}'})
+    res = conn.getresponse()
+    body = json.loads(res.read())
+    conn.close()
+    return res.status, body
+
+
+@pytest.mark.parametrize('kind, job, error', [
+    ('po2tag', {'filters': FILTERS,
+                'rules': [{'name': 'Installed', 'regex': '^chrome'}]},
+     'category'),
+    ('po2tag', {'filters': FILTERS}, 'must be defined'),
+    ('po2tag', {'filters': '{bad', 'rules': RULES}, 'must be an object'),
+    ('po2tag', {'filters': FILTERS, 'rules': RULES, 'batch_size': 0},
+     'batch_size'),
+    ('po2tag', {'rules': '@/etc/passwd'}, 'files'),
+    ('create-rg', dict(GOAL, conditions='{bad'), 'Unable to load JSON'),
+    ('create-rg', dict(GOAL, description='@/etc/passwd'), 'files'),
+    ('create-rg', dict(GOAL, conditions='@/etc/passwd'), 'files'),
+    ('create-rg', dict(GOAL, start_date=None), 'start_date'),
+    ('group2tag', [], 'must be an object'),
+])
+def test_invalid_jobs(server, kind, job, error):
+    status, body = _post(server, kind, job)
+    assert status == 400
+    assert error in body['error']
+    assert server.app.jobs == {'running': 0, 'done': 0, 'failed': 1}
+
+
+def test_local_jobs_can_read_files(tio, tmp_path):
+    path = tmp_path / 'conditions.json'
+    path.write_text('{bad')
+    job = dict(GOAL, conditions=f'@{path}')
+    with pytest.raises(ValueError, match='Unable to load JSON file'):
+        Daemon(tio).run('create-rg', job, files=True)
@@ -0,0 +1,59 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from tenable_helpers import decoding
+
+ITEMS = [{'id': 1, 'output': 'the "pagination" key'}, {'id': 2}]
+
+
+def _res(body):
+    return SimpleNamespace(content=json.dumps(body).encode())
+
+
+@pytest.mark.parametrize('stream', [False, True])
+@pytest.mark.parametrize('body', [
+    # at the end, as sent by the API
+    {'findings': ITEMS, 'pagination': {'next': 'x', 'total': 2}},
+    # anywhere else: scanned for
+    {'pagination': {'next': 'x', 'total': 2}, 'findings': ITEMS},
+])
+def test_page(body, stream):
+    items, token = decoding.page(_res(body), 'findings', stream=stream)
+    assert list(items) == ITEMS
+    assert token == 'x'
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_last_page(stream):
+    items, token = decoding.page(_res({'findings': ITEMS}), 'findings',
+                                 stream=stream)
+    assert list(items) == ITEMS
+    assert token is None
+
+
+def test_pagination_tail():
+    data = json.dumps({'findings': ITEMS,
+                       'pagination': {'next': 'x'}}).encode()
+    assert decoding._pagination(data) == {'next': 'x'}
+    # a "pagination" string in the items is not the key
+    data = json.dumps({'pagination': {'next': 'y'},
+                       'findings': ITEMS + [{'pagination': 1}]}).encode()
+    assert decoding._pagination(data) == {'next': 'y'}
+    assert decoding._pagination(json.dumps(ITEMS).encode()) is None
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_chunk(stream):
+    res = _res(ITEMS)
+    assert list(decoding.chunk(res, stream=stream)) == ITEMS
+
+
+def test_without_ijson(monkeypatch):
+    monkeypatch.setattr(decoding, '_ijson', lambda: None)
+    assert not decoding.can_stream()
+    body = {'findings': ITEMS, 'pagination': {'next': 'x'}}
+    items, token = decoding.page(_res(body), 'findings', stream=True)
+    assert (items, token) == (ITEMS, 'x')
+    assert list(decoding.iter_items(_res(body).content, 'findings')) == ITEMS
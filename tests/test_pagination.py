@@ -0,0 +1,78 @@
+import pytest
+
+from tenable_helpers import pagination
+from tenable_helpers.pagination import Paginator
+
+
+def _fetch(n, requests=None, fail_at=None):
+    # n items, the token is the offset of the next page
+    def fetch(limit, token):
+        start = int(token or 0)
+        if requests is not None:
+            requests.append((start, limit))
+        if start == fail_at:
+            raise ConnectionError('connection reset by peer')
+        end = min(n, start + limit)
+        return list(range(start, end)), str(end) if end < n else None
+    return fetch
+
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_pages(prefetch):
+    paginator = Paginator(_fetch(25), limit=10, prefetch=prefetch)
+    assert [len(p) for p in paginator.pages()] == [10, 10, 5]
+    assert list(paginator) == list(range(25))
+    assert (paginator.pages_fetched, paginator.results) == (3, 25)
+    assert paginator.token is None
+
+
+def test_max_results():
+    requests = []
+    paginator = Paginator(_fetch(100, requests), limit=10, max_results=25)
+    assert list(paginator) == list(range(25))
+    # the last request only asks for what is missing
+    assert requests == [(0, 10), (10, 10), (20, 5)]
+
+
+def test_resume():
+    paginator = Paginator(_fetch(25), limit=10)
+    pages = paginator.pages()
+    next(pages)
+    token = paginator.token
+    pages.close()
+
+    paginator = Paginator(_fetch(25), limit=10, token=token)
+    assert list(paginator) == list(range(10, 25))
+
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_errors(prefetch):
+    paginator = Paginator(_fetch(25, fail_at=10), limit=10,
+                          prefetch=prefetch)
+    pages = paginator.pages()
+    assert next(pages) == list(range(10))
+    with pytest.raises(ConnectionError):
+        next(pages)
+    assert paginator.token == '10'
+
+
+def test_stream():
+    def fetch(limit, token):
+        start = int(token or 0)
+        end = min(25, start + limit)
+        return iter(range(start, end)), str(end) if end < 25 else None
+
+    paginator = Paginator(fetch, limit=10, max_results=15)
+    assert [list(p) for p in paginator.pages()] == [
+        list(range(10)), list(range(10, 15))]
+    assert paginator.results == 15
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_findings(tio, stream):
+    search = tio.v3.explore.findings.search_host
+    search.items = [{'asset': {'id': f'a{i}'}} for i in range(5)]
+    paginator = pagination.findings(tio, {}, limit=2, stream=stream)
+    assert [[f['asset']['id'] for f in p] for p in paginator.pages()] == [
+        ['a0', 'a1'], ['a2', 'a3'], ['a4']]
+    assert search.calls == 3
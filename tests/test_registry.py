@@ -0,0 +1,46 @@
+from tenable_helpers.cache import Cache
+from tenable_helpers.commons import TagRegistry
+
+
+def test_live_list_is_complete(tio):
+    tio.tags.create('AgentGroup', 'g0')
+    registry = TagRegistry(tio)
+    assert registry.complete
+    registry.create_many([('AgentGroup', 'g0'), ('AgentGroup', 'g1')])
+    assert tio.tags.lookups == 0
+    assert len(tio.tags.tags) == 2
+
+
+def test_cached_runs(tio, tmp_path):
+    path = str(tmp_path / 'cache.db')
+    pairs = [('AgentGroup', 'g1'), ('AgentGroup', 'g2')]
+    TagRegistry(tio, cache=Cache(path)).create_many(pairs)
+
+    # the tags created by the first run are in the cached list
+    registry = TagRegistry(tio, cache=Cache(path))
+    assert not registry.complete
+    tags = registry.create_many(pairs)
+    assert tio.tags.lookups == 0
+    assert {k: t['uuid'] for k, t in tags.items()} == {
+        (t['category_name'], t['value']): t['uuid'] for t in tio.tags.tags}
+
+
+def test_cached_list_misses_are_looked_up(tio, tmp_path):
+    path = str(tmp_path / 'cache.db')
+    TagRegistry(tio, cache=Cache(path))
+
+    # created by another tool after the list was cached
+    tio.tags.create('AgentGroup', 'g3')
+    registry = TagRegistry(tio, cache=Cache(path))
+    assert registry.get('AgentGroup', 'g3') is not None
+    assert tio.tags.lookups == 1
+
+
+def test_eviction(tio):
+    for i in range(3):
+        tio.tags.create('AgentGroup', f'g{i}')
+    registry = TagRegistry(tio, maxsize=2)
+    assert not registry.complete
+    assert len(registry) == 2
+    assert registry.get('AgentGroup', 'g0') is not None
+    assert tio.tags.lookups == 1
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from tenable_helpers import runner
+
+FILTERS = {'and': [{'property': 'definition.id', 'operator': 'eq',
+                    'value': ['20811']}]}
+RULES = [{'category': 'Chrome', 'name': 'Installed', 'regex': '^chrome'}]
+
+
+def _job_file(tmp_path, jobs):
+    path = tmp_path / 'jobs' / 'jobs.json'
+    path.parent.mkdir()
+    path.write_text(json.dumps({'jobs': jobs}))
+    return str(path)
+
+
+def test_file_values_are_relative_to_the_job_file(tmp_path, monkeypatch):
+    (tmp_path / 'filters.json').write_text(json.dumps(FILTERS))
+    path = _job_file(tmp_path, [
+        {'type': 'po2tag', 'filters': '@../filters.json', 'rules': RULES}])
+
+    monkeypatch.chdir('/')
+    data, jobs = runner.load_jobs(path)
+    assert jobs[0]['name'] == 'po2tag-1'
+    assert jobs[0]['filters'] == f'@{tmp_path / "filters.json"}'
+    [(kind, (filters, consumers))] = runner.plan(jobs)
+    assert kind == 'po2tag'
+    assert filters == FILTERS
+
+
+def test_duplicate_names(tmp_path):
+    path = _job_file(tmp_path, [
+        {'name': 'a', 'type': 'po2tag'}, {'name': 'a', 'type': 'group2tag'}])
+    with pytest.raises(ValueError, match='more than once'):
+        runner.load_jobs(path)
+
+
+def test_invalid_jobs_fail_alone(tmp_path):
+    path = _job_file(tmp_path, [
+        {'name': 'good', 'type': 'po2tag', 'filters': FILTERS,
+         'rules': RULES},
+        {'name': 'no-category', 'type': 'po2tag', 'filters': FILTERS,
+         'rules': [{'name': 'Installed', 'regex': '^chrome'}]},
+        {'name': 'bad-filters', 'type': 'po2tag', 'filters': '{bad',
+         'rules': RULES},
+        {'name': 'missing-file', 'type': 'po2tag', 'filters': FILTERS,
+         'rules': '@missing.json'}])
+
+    data, jobs = runner.load_jobs(path)
+    units = runner.plan(jobs)
+    assert [(kind, runner._names(kind, payload))
+            for kind, payload in units] == [
+        ('invalid', ['no-category']),
+        ('invalid', ['bad-filters']),
+        ('invalid', ['missing-file']),
+        ('po2tag', ['good'])]
+
+    # the invalid units fail without touching the API
+    results = runner.run(None, units[:3])
+    assert all(isinstance(e, ValueError) for e in results.values())
+    assert 'category' in str(results['no-category'])
+
+
+@pytest.mark.parametrize('rates, error', [
+    ({'read': 50, 'write': 0}, None),
+    ({'reads': 50}, 'Unknown rate'),
+    ({'write': -1}, 'write rate'),
+    ({'read': 'fast'}, 'read rate'),
+])
+def test_rates(tmp_path, rates, error):
+    path = tmp_path / 'jobs.json'
+    path.write_text(json.dumps({'options': {'rates': rates}, 'jobs': []}))
+    if error is None:
+        data, jobs = runner.load_jobs(str(path))
+        assert data['options']['rates'] == rates
+    else:
+        with pytest.raises(ValueError, match=error):
+            runner.load_jobs(str(path))
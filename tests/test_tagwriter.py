@@ -0,0 +1,43 @@
+import pytest
+
+from tenable_helpers.commons import TagWriter
+
+
+def _assets(*ids):
+    return [{'id': i, 'name': f'host-{i}'} for i in ids]
+
+
+@pytest.mark.parametrize('batch_size', [0, -1])
+def test_batch_size(tio, batch_size):
+    with pytest.raises(ValueError):
+        TagWriter(tio, 't', 'Test:Match', batch_size=batch_size)
+
+
+def test_batches(tio):
+    with TagWriter(tio, 't', 'Test:Match', batch_size=2) as w:
+        w.add(_assets(1, 2, 3))
+        assert tio.tags.writes == [[1, 2]]
+        assert w.pending() == _assets(3)
+    assert tio.tags.writes == [[1, 2], [3]]
+    assert (w.written, w.jobs) == (3, 2)
+
+
+def test_unassign(tio):
+    tio.tags.assigned['t'] = {1, 2}
+    with TagWriter(tio, 't', 'Test:Match', 'unassign') as w:
+        w.add(_assets(1))
+    assert tio.tags.assigned['t'] == {2}
+
+
+def test_flush_interval(tio, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr('time.monotonic', lambda: now[0])
+    w = TagWriter(tio, 't', 'Test:Match', flush_interval=5)
+    w.add(_assets(1))
+    w.tick()
+    assert tio.tags.writes == []
+
+    # flushed by the next tick, even if no asset is added
+    now[0] = 5.0
+    w.tick()
+    assert tio.tags.writes == [[1]]
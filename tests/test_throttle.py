@@ -0,0 +1,140 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from tenable_helpers import throttle
+
+
+def _tio():
+    calls = []
+
+    def _req(method, path, **kwargs):
+        calls.append((method, path))
+        return SimpleNamespace(status_code=200)
+
+    return SimpleNamespace(_req=_req, _session=SimpleNamespace(
+        hooks={'response': []}), calls=calls)
+
+
+@pytest.mark.parametrize('method, path, read', [
+    ('GET', 'agents', True),
+    ('POST', 'api/v3/findings/vulnerabilities/host/search', True),
+    ('POST', 'vulns/export', True),
+    ('POST', 'assets/v2/export/', True),
+    ('POST', 'tags/assets/assignments', False),
+    ('POST', 'tags/values', False),
+    ('DELETE', 'tags/values/x', False),
+])
+def test_is_read(method, path, read):
+    assert throttle.is_read(method, path) == read
+
+
+def test_default_rates():
+    scheduler = throttle.Scheduler()
+    assert scheduler.read.bucket.rate == throttle.READ_RATE
+    assert scheduler.write.bucket.rate == throttle.WRITE_RATE
+
+
+def test_rates():
+    tio = _tio()
+    scheduler = throttle.install(tio, read_rate=50, write_rate=0)
+    assert scheduler.read.bucket.rate == 50
+    # no rate: only the concurrency is limited
+    assert scheduler.write.bucket is None
+    tio._req('POST', 'tags/values')
+    assert tio.calls == [('POST', 'tags/values')]
+    assert tio._session.hooks['response'] == [scheduler._on_response]
+
+
+def test_token_bucket():
+    bucket = throttle.TokenBucket(100, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # the first token is there, the other 5 come at 100/s
+    assert time.monotonic() - start >= 0.04
+
+
+def test_aimd():
+    budget = throttle.Budget('read', 0, concurrency=8, min_concurrency=2)
+    budget.throttle(0)
+    assert budget.limit == 4
+    budget.throttle(0)
+    budget.throttle(0)
+    assert budget.limit == 2
+
+    # additive increase: about +1 every "limit" successful requests
+    budget.success()
+    budget.success()
+    assert int(budget.limit) == 2
+    budget.success()
+    assert int(budget.limit) == 3
+    for _ in range(100):
+        budget.success()
+    assert budget.limit == 8
+    assert (budget.requests, budget.throttled) == (106, 3)
+
+
+def test_throttle_pauses_new_requests():
+    budget = throttle.Budget('write', 0)
+    budget.throttle(0.1)
+    start = time.monotonic()
+    budget.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_concurrency_limit():
+    budget = throttle.Budget('write', 0, concurrency=1)
+    budget.acquire()
+    started = threading.Event()
+
+    def _request():
+        budget.acquire()
+        started.set()
+        budget.release()
+
+    t = threading.Thread(target=_request)
+    t.start()
+    assert not started.wait(0.1)
+    budget.release()
+    assert started.wait(1)
+    t.join()
+
+
+class TooManyRequests(Exception):
+    response = SimpleNamespace(status_code=429, headers={'retry-after': '0'})
+
+
+def test_retries():
+    scheduler = throttle.Scheduler(max_retries=2)
+    responses = [TooManyRequests(), TooManyRequests(), 'ok']
+
+    def _fn():
+        r = responses.pop(0)
+        if isinstance(r, Exception):
+            raise r
+        return r
+
+    assert scheduler.call(scheduler.read, _fn) == 'ok'
+    assert scheduler.read.in_flight == 0
+
+    responses = [TooManyRequests()] * 3
+    with pytest.raises(TooManyRequests):
+        scheduler.call(scheduler.read, _fn)
+
+
+def test_async_retries():
+    scheduler = throttle.AsyncScheduler(read_rate=0)
+    statuses = [429, 429, 200]
+
+    async def _fn():
+        return SimpleNamespace(status_code=statuses.pop(0),
+                               headers={'retry-after': '0'})
+
+    res = asyncio.run(scheduler.call(scheduler.read, _fn))
+    assert res.status_code == 200
+    assert (scheduler.read.requests, scheduler.read.throttled) == (3, 2)
+    assert scheduler.read.in_flight == 0